@@ -1,18 +1,155 @@
+import os
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QTextEdit, QFileDialog, QLabel, QLineEdit, QMessageBox
+import glob
+import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtWidgets import (
+    QApplication, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QTextEdit, QFileDialog, QLabel, QLineEdit,
+    QMessageBox, QTableView, QProgressBar
+)
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QAbstractTableModel, QModelIndex
 from PyQt5.QtGui import QFont
-from Bio import SeqIO
+
+RESULT_HEADER = ('File Name', 'Species Name', 'Accession Number')
+
+# The header fields of one GenBank record
+GenBankHeader = namedtuple('GenBankHeader', ['locus', 'accession', 'organism'])
+
+# Continuation lines of GenBank header fields start with this indent
+GENBANK_INDENT = 12
+
+
+def scan_genbank_headers(gb_file):
+    """Read the LOCUS, ACCESSION and ORGANISM lines of every record in a GenBank file.
+
+    Each record is read up to its FEATURES or ORIGIN line and the rest of it
+    is skipped up to '//', so features and sequences are never parsed. As in
+    Biopython, the organism takes the ORGANISM continuation lines up to the
+    taxonomy and defaults to 'Unknown'; a record without an ACCESSION line
+    is an error.
+    """
+    headers = []
+    with open(gb_file) as handle:
+        line = handle.readline()
+        while line:
+            if not line.startswith('LOCUS'):
+                line = handle.readline()
+                continue
+            fields = line.split()
+            locus = fields[1] if len(fields) > 1 else ''
+            accession, organism = None, None
+            line = handle.readline()
+            while line and not line.startswith(('FEATURES', 'ORIGIN', '//')):
+                if line.startswith('ACCESSION'):
+                    accessions = line[GENBANK_INDENT:].replace(';', ' ').split()
+                    accession = accessions[0] if accessions else None
+                elif line.startswith('  ORGANISM'):
+                    organism = line[GENBANK_INDENT:].strip()
+                    line = handle.readline()
+                    # Name lines come before the ';'-separated taxonomy
+                    while line.startswith(' ' * GENBANK_INDENT):
+                        text = line[GENBANK_INDENT:].strip()
+                        if ';' in line or text == '.':
+                            break
+                        organism += ' ' + text
+                        line = handle.readline()
+                    continue
+                line = handle.readline()
+            if accession is None:
+                raise ValueError(f"No ACCESSION line in record '{locus}' of {gb_file}")
+            headers.append(GenBankHeader(locus, accession, organism or 'Unknown'))
+            while line and not line.startswith('//'):
+                line = handle.readline()
+    return headers
+
+
+def extract_accessions(gb_files, jobs=None, progress_callback=None):
+    """Scan many GenBank files on a pool of `jobs` threads.
+
+    progress_callback(done, total) is called as files finish in input
+    order. Returns (file name, species name, accession) rows in input order
+    and a list of (file, error message) pairs for files that could not be
+    read.
+    """
+    rows, errors = [], []
+
+    def scan(gb_file):
+        try:
+            return scan_genbank_headers(gb_file), None
+        except Exception as e:
+            return [], f"{type(e).__name__}: {e}"
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for done, (gb_file, (headers, error)) in enumerate(zip(gb_files, executor.map(scan, gb_files)), start=1):
+            file_name = os.path.basename(gb_file)
+            rows.extend((file_name, header.organism, header.accession) for header in headers)
+            if error is not None:
+                errors.append((gb_file, error))
+            if progress_callback is not None:
+                progress_callback(done, len(gb_files))
+    return rows, errors
+
+
+def write_accessions(output_file, rows):
+    with open(output_file, 'w') as out_file:
+        out_file.write('\t'.join(RESULT_HEADER) + '\n')
+        out_file.write(''.join(f'{data[0]}\t{data[1]}\t{data[2]}\n' for data in rows))
+
+
+class AccessionTableModel(QAbstractTableModel):
+    """Read-only table of extracted rows, replaced in one reset instead of row by row."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = list(rows)
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(RESULT_HEADER)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.rows[index.row()][index.column()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return RESULT_HEADER[section]
+        return super().headerData(section, orientation, role)
+
+
+class AcExtractThread(QThread):
+    progress = pyqtSignal(int)
+
+    def __init__(self, gb_files):
+        super().__init__()
+        self.gb_files = gb_files
+        self.rows = []
+        self.errors = []
+
+    def run(self):
+        self.rows, self.errors = extract_accessions(
+            self.gb_files, progress_callback=lambda done, total: self.progress.emit(int(done / total * 100)))
+
 
 class AcExtractApp(QWidget):
     def __init__(self):
         super().__init__()
+        self.extracted_data = []
         self.initUI()
 
     def initUI(self):
         self.setWindowTitle('GenBank File Species and Accession Extractor')
         self.setGeometry(100, 100, 800, 600)
 
-        # Title label
         title_label = QLabel('Extract Accession Numbers From GBFiles')
         title_label.setFont(QFont('Arial', 16))
 
@@ -20,11 +157,15 @@ class AcExtractApp(QWidget):
         input_label = QLabel('Input Files:')
         result_label = QLabel('Results:')
 
-        # Text boxes
+        # Input file list and result table
         self.input_text = QTextEdit()
         self.input_text.setReadOnly(True)
-        self.result_text = QTextEdit()
-        self.result_text.setReadOnly(True)
+        self.result_model = AccessionTableModel(self)
+        self.result_table = QTableView()
+        self.result_table.setModel(self.result_model)
+        self.result_table.horizontalHeader().setStretchLastSection(True)
+        self.status_label = QLabel()
+        self.progress_bar = QProgressBar()
 
         # Open files button
         self.btn_open = QPushButton('Open GenBank Files')
@@ -56,8 +197,10 @@ class AcExtractApp(QWidget):
 
         text_layout = QHBoxLayout()
         text_layout.addWidget(self.input_text)
-        text_layout.addWidget(self.result_text)
+        text_layout.addWidget(self.result_table)
         layout.addLayout(text_layout)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.status_label)
 
         buttons_layout = QHBoxLayout()
         buttons_layout.addWidget(self.btn_open)
@@ -79,10 +222,7 @@ class AcExtractApp(QWidget):
         file_names, _ = QFileDialog.getOpenFileNames(self, 'Open GenBank Files', '', 'GenBank Files (*.gb *.gbk);;All Files (*)', options=options)
         if file_names:
             self.file_paths = file_names
-            self.input_text.clear()
-            self.input_text.append('Selected files:')
-            for file_path in self.file_paths:
-                self.input_text.append(file_path)
+            self.input_text.setPlainText('Selected files:\n' + '\n'.join(self.file_paths))
 
     def select_output_directory(self):
         options = QFileDialog.Options()
@@ -95,39 +235,72 @@ class AcExtractApp(QWidget):
         try:
             gb_files = self.file_paths
         except AttributeError:
-            self.result_text.append('Please select GenBank files first.')
+            self.status_label.setText('Please select GenBank files first.')
             return
 
-        self.result_text.clear()
         self.extracted_data = []
+        self.result_model.set_rows([])
+        self.status_label.clear()
+        self.progress_bar.setValue(0)
+        self.btn_process.setEnabled(False)
 
-        try:
-            self.result_text.append('File Name\tSpecies Name\tAccession Number')
-            for gb_file in gb_files:
-                file_name = gb_file.split('/')[-1]  # Extract file name from path
-                for record in SeqIO.parse(gb_file, 'genbank'):
-                    species_name = record.annotations.get('organism', 'Unknown')
-                    accession = record.annotations['accessions'][0]
-                    self.extracted_data.append((file_name, species_name, accession))
-                    self.result_text.append(f'{file_name}\t{species_name}\t{accession}')
-        except Exception as e:
-            self.result_text.append(f'Error processing files: {str(e)}')
+        self.worker = AcExtractThread(gb_files)
+        self.worker.progress.connect(self.progress_bar.setValue)
+        self.worker.finished.connect(self.process_finished)
+        self.worker.start()
+
+    def process_finished(self):
+        self.btn_process.setEnabled(True)
+        self.extracted_data = self.worker.rows
+        self.result_model.set_rows(self.extracted_data)
+        status = f'{len(self.extracted_data)} records from {len(self.worker.gb_files)} files.'
+        if self.worker.errors:
+            status += '\nError processing files:\n' + '\n'.join(f'{os.path.basename(gb_file)}: {error}'
+                                                              for gb_file, error in self.worker.errors)
+        self.status_label.setText(status)
 
     def save_file(self):
         try:
             output_file = self.output_directory + '/species_accession_files.txt'
-            with open(output_file, 'w') as out_file:
-                out_file.write('File Name\tSpecies Name\tAccession Number\n')
-                for data in self.extracted_data:
-                    out_file.write(f'{data[0]}\t{data[1]}\t{data[2]}\n')
+            write_accessions(output_file, self.extracted_data)
 
             QMessageBox.information(self, 'File Saved', f'Species names, accession numbers, and file names saved to {output_file}')
         except AttributeError:
-            self.result_text.append('Please select an output directory first.')
+            self.status_label.setText('Please select an output directory first.')
         except Exception as e:
-            self.result_text.append(f'Error saving file: {str(e)}')
+            self.status_label.setText(f'Error saving file: {str(e)}')
+
+
+def main(argv=None):
+    """Extract accessions without the GUI, e.g. on a server holding a large NCBI download."""
+    parser = argparse.ArgumentParser(description="Extract species names and accession numbers from GenBank files.")
+    parser.add_argument('-i', '--input', nargs='+', required=True,
+                        help='GenBank files, glob patterns (quote them) or directories holding .gb/.gbk files')
+    parser.add_argument('-o', '--output', required=True, help='Output table, e.g. species_accession_files.txt')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of reader threads')
+    args = parser.parse_args(argv)
+
+    gb_files = []
+    for pattern in args.input:
+        if os.path.isdir(pattern):
+            gb_files.extend(sorted(os.path.join(pattern, name) for name in os.listdir(pattern)
+                                   if name.endswith(('.gb', '.gbk'))))
+        else:
+            gb_files.extend(sorted(path for path in glob.glob(pattern) if os.path.isfile(path)))
+    if not gb_files:
+        parser.error("no GenBank files matched the input")
+
+    rows, errors = extract_accessions(gb_files, args.jobs)
+    write_accessions(args.output, rows)
+    for gb_file, error in errors:
+        print(f"Error processing {gb_file}: {error}", file=sys.stderr)
+    print(f"{len(rows)} records from {len(gb_files)} files written to {args.output}", file=sys.stderr)
+    return 1 if errors else 0
+
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        sys.exit(main())
     app = QApplication(sys.argv)
     window = AcExtractApp()
     window.show()
@@ -18,11 +18,76 @@ import sys
 import os
 import logging
 from PyQt5.QtWidgets import (
-    QApplication, QWidget, QPushButton, QLabel, QFileDialog, QPlainTextEdit, QVBoxLayout, QHBoxLayout, QMessageBox, QLineEdit
+    QApplication, QWidget, QPushButton, QLabel, QFileDialog, QPlainTextEdit, QVBoxLayout, QHBoxLayout, QMessageBox, QLineEdit,
+    QCheckBox
 )
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont
-from Bio import SeqIO
+from modules.function_modules.Extract.Extract_index import GenBankIndex, extract_parts
+
+
+def is_cds_file(input_file):
+    return os.path.isfile(input_file) and (input_file.endswith(".gb") or input_file.endswith(".gbk"))
+
+
+def collect_cds(input_file):
+    """Parse a GenBank file once and return its CDS sequences as {gene name: [sequences]} in file order.
+
+    A CDS without a gene qualifier is named after its locus tag, or 'Unknown'.
+    """
+    index = GenBankIndex(input_file)
+    cds = {}
+    for record in index.records:
+        for feature in record.features:
+            if feature.type == "CDS":
+                gene_name = feature.gene or feature.locus_tag or "Unknown"
+                cds.setdefault(gene_name, []).append(extract_parts(record.seq, feature.parts))
+    return cds
+
+
+def write_cds_outputs(all_cds, common_cds, output_directory, individual_files=True):
+    """Write the extracted CDS of the common genes from {species: {gene name: [sequences]}}.
+
+    common_cds/<gene>.fasta holds every copy of a gene from every species.
+    individual_cds/<species>_combined.fasta holds each species' genes once,
+    skipping repeated sequences. With individual_files, every species also
+    gets an individual_cds/<species>/<gene>.fasta per gene. Each file is
+    assembled in memory and written at once. Returns the combined file paths.
+    """
+    individual_dir = os.path.join(output_directory, "individual_cds")
+    os.makedirs(individual_dir, exist_ok=True)
+    combined_dir = os.path.join(output_directory, "common_cds")
+    os.makedirs(combined_dir, exist_ok=True)
+    gene_names = sorted(common_cds)
+
+    combined_files = []
+    for gene_name in gene_names:
+        combined_fasta_file = os.path.join(combined_dir, f"{gene_name}.fasta")
+        with open(combined_fasta_file, "w") as combined_fasta_handle:
+            combined_fasta_handle.write(''.join(f">{species_name}_{gene_name}\n{cds_sequence}\n"
+                                                for species_name, cds in all_cds.items()
+                                                for cds_sequence in cds[gene_name]))
+        combined_files.append(combined_fasta_file)
+
+    for species_name, cds in all_cds.items():
+        # A gene annotated more than once is represented by its last copy, as in the per-gene files
+        last_copies = [(gene_name, cds[gene_name][-1]) for gene_name in gene_names]
+        if individual_files:
+            species_dir = os.path.join(individual_dir, species_name)
+            os.makedirs(species_dir, exist_ok=True)
+            for gene_name, cds_sequence in last_copies:
+                with open(os.path.join(species_dir, f"{gene_name}.fasta"), "w") as individual_fasta_handle:
+                    individual_fasta_handle.write(f">{species_name}_{gene_name}\n{cds_sequence}\n")
+        seen_sequences = set()
+        entries = []
+        for gene_name, cds_sequence in last_copies:
+            if cds_sequence not in seen_sequences:
+                entries.append(f">{species_name}_{gene_name}\n{cds_sequence}\n")
+                seen_sequences.add(cds_sequence)
+        with open(os.path.join(individual_dir, f"{species_name}_combined.fasta"), "w") as combined_fasta_handle:
+            combined_fasta_handle.write(''.join(entries))
+    return combined_files
+
 
 class commoncdsExtractApp(QWidget):
     def __init__(self):
@@ -58,6 +123,10 @@ class commoncdsExtractApp(QWidget):
         output_layout.addWidget(self.output_textedit)
         output_layout.addWidget(self.output_button)
 
+        # Tiny per-gene files are optional: on shared file systems they can run to tens of thousands
+        self.individual_checkbox = QCheckBox('Write one file per gene per species (individual_cds/<species>/)')
+        self.individual_checkbox.setChecked(True)
+
         # Run button
         self.run_button = QPushButton('Run Extraction')
         self.run_button.clicked.connect(self.run_extraction)
@@ -70,6 +139,7 @@ class commoncdsExtractApp(QWidget):
         
         layout.addLayout(file_layout)
         layout.addLayout(output_layout)
+        layout.addWidget(self.individual_checkbox)
         layout.addWidget(self.run_button)
         
         self.setLayout(layout)
@@ -95,10 +165,12 @@ class commoncdsExtractApp(QWidget):
             QMessageBox.warning(self, 'Missing Input', 'Please select input files and output directory.')
             return
 
-        common_cds = self.find_common_cds(input_files)
+        # Every file is parsed once; the common names and the sequences both come from this pass
+        all_cds = self.collect_all_cds(input_files)
+        common_cds = self.find_common_cds(all_cds)
         if common_cds:
             self.logger.info(f'Common CDS names: {common_cds}')
-            success = self.extract_and_save_cds_sequences(input_files, output_directory, common_cds)
+            success = self.extract_and_save_cds_sequences(all_cds, output_directory, common_cds)
             if success:
                 QMessageBox.information(self, 'Extraction Complete', 'CDS extraction and saving completed successfully.')
             else:
@@ -106,96 +178,40 @@ class commoncdsExtractApp(QWidget):
         else:
             QMessageBox.warning(self, 'No Common CDS', 'No common CDS names found.')
 
-    def find_common_cds(self, input_files):
-        """Find common CDS names from all GenBank files in the given directory."""
-        common_cds = None
+    def collect_all_cds(self, input_files):
+        """Parse every GenBank file once into {species: {gene name: [sequences]}}."""
+        all_cds = {}
         for input_file in input_files:
-            if os.path.isfile(input_file) and (input_file.endswith(".gb") or input_file.endswith(".gbk")):
-                cds_names = set()
-                with open(input_file, 'r') as handle:
-                    for record in SeqIO.parse(handle, 'genbank'):
-                        for feature in record.features:
-                            if feature.type == 'CDS':
-                                gene_name = feature.qualifiers.get('gene', feature.qualifiers.get('locus_tag', ['Unknown']))[0]
-                                cds_names.add(gene_name)
-                if common_cds is None:
-                    common_cds = cds_names
-                else:
-                    common_cds = common_cds.intersection(cds_names)
-                self.logger.info(f"Updated common CDS names after processing {input_file}: {common_cds}")
+            if is_cds_file(input_file):
+                self.logger.info(f"Processing file {input_file}")
+                species_name = os.path.splitext(os.path.basename(input_file))[0]
+                species_cds = all_cds.setdefault(species_name, {})
+                for gene_name, sequences in collect_cds(input_file).items():
+                    species_cds.setdefault(gene_name, []).extend(sequences)
+        return all_cds
+
+    def find_common_cds(self, all_cds):
+        """Find the CDS names shared by all parsed GenBank files."""
+        common_cds = None
+        for species_name, cds in all_cds.items():
+            common_cds = set(cds) if common_cds is None else common_cds.intersection(cds)
+            self.logger.info(f"Updated common CDS names after processing {species_name}: {common_cds}")
         return common_cds
 
-    def extract_and_save_cds_sequences(self, input_files, output_directory, common_cds):
-        """Extract and save CDS sequences of common CDS names from all GenBank files."""
+    def extract_and_save_cds_sequences(self, all_cds, output_directory, common_cds):
+        """Save the CDS sequences of the common CDS names from all GenBank files."""
         try:
-            individual_dir = os.path.join(output_directory, "individual_cds")
-            os.makedirs(individual_dir, exist_ok=True)
-            
-            combined_dir = os.path.join(output_directory, "common_cds")
-            os.makedirs(combined_dir, exist_ok=True)
-            
-            cds_sequences = {cds: [] for cds in common_cds}
-
-            for input_file in input_files:
-                if os.path.isfile(input_file) and (input_file.endswith(".gb") or input_file.endswith(".gbk")):
-                    species_name = os.path.splitext(os.path.basename(input_file))[0]
-                    species_dir = os.path.join(individual_dir, species_name)
-                    os.makedirs(species_dir, exist_ok=True)
-                    self.logger.info(f"Processing file {input_file}")
-                    
-                    with open(input_file, "r") as handle:
-                        for record in SeqIO.parse(handle, "genbank"):
-                            for feature in record.features:
-                                if feature.type == "CDS":
-                                    gene_name = feature.qualifiers.get("gene", feature.qualifiers.get("locus_tag", ["Unknown"]))[0]
-                                    if gene_name in common_cds:
-                                        cds_sequence = feature.location.extract(record).seq
-                                        
-                                        individual_fasta_file = os.path.join(species_dir, f"{gene_name}.fasta")
-                                        with open(individual_fasta_file, "w") as individual_fasta_handle:
-                                            individual_fasta_handle.write(f">{species_name}_{gene_name}\n{cds_sequence}\n")
-                                        self.logger.info(f"Saved CDS sequence for {gene_name} from {species_name} to {individual_fasta_file}")
-                                        
-                                        fasta_entry = f">{species_name}_{gene_name}\n{cds_sequence}\n"
-                                        cds_sequences[gene_name].append(fasta_entry)
-
-            for gene_name, sequences in cds_sequences.items():
-                combined_fasta_file = os.path.join(combined_dir, f"{gene_name}.fasta")
-                with open(combined_fasta_file, "w") as combined_fasta_handle:
-                    combined_fasta_handle.writelines(sequences)
-                self.logger.info(f"Saved combined CDS sequences for {gene_name} to {combined_fasta_file}")
-
-            self.combine_species_cds_sequences(individual_dir, common_cds)
-            return True  # Assume success for simplicity
+            combined_files = write_cds_outputs(all_cds, common_cds, output_directory,
+                                               self.individual_checkbox.isChecked())
+            self.logger.info(f"Saved combined CDS sequences of {len(combined_files)} genes from "
+                             f"{len(all_cds)} species to {os.path.join(output_directory, 'common_cds')}")
+            return True
 
         except Exception as e:
             self.logger.error(f"Error during extraction: {e}")
             QMessageBox.critical(self, 'Extraction Error', f'Error during extraction: {e}')
             return False
 
-    def combine_species_cds_sequences(self, individual_dir, common_cds):
-        """Combine CDS sequences of each species into a single file without duplicates."""
-        for species_folder in os.listdir(individual_dir):
-            species_folder_path = os.path.join(individual_dir, species_folder)
-            if os.path.isdir(species_folder_path):
-                combined_species_file = os.path.join(individual_dir, f"{species_folder}_combined.fasta")
-                seen_sequences = set()
-                with open(combined_species_file, "w") as combined_fasta_handle:
-                    for cds_name in common_cds:
-                        cds_file = os.path.join(species_folder_path, f"{cds_name}.fasta")
-                        if os.path.exists(cds_file):
-                            with open(cds_file, "r") as single_cds_handle:
-                                for line in single_cds_handle:
-                                    if line.startswith(">"):
-                                        sequence_id = line.strip()
-                                        sequence = ""
-                                    else:
-                                        sequence = line.strip()
-                                        if sequence not in seen_sequences:
-                                            combined_fasta_handle.write(f"{sequence_id}\n{sequence}\n")
-                                            seen_sequences.add(sequence)
-                self.logger.info(f"Combined CDS sequences for {species_folder} into {combined_species_file}")
-
     def setup_logger(self):
         log_file = "genbank_cds_extraction.log"
         logging.basicConfig(level=logging.INFO, 
@@ -8,39 +8,50 @@ site:   https://github.com/Xwb7533/CPStools
 """
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QLineEdit, QFileDialog, QTextEdit, QProgressBar
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QLineEdit, QFileDialog, QTextEdit, QProgressBar, QSpinBox
 from PyQt5.QtGui import QFont
 from Bio import SeqIO
+from modules.function_modules.Extract.Extract_index import GENE_TYPES, GenBankIndex, index_genbank_files, is_genbank
 
 class ExtractionThread(QThread):
     progress = pyqtSignal(int)
     log = pyqtSignal(str)
 
-    def __init__(self, input_files, output_dir):
+    def __init__(self, input_files, output_dir, jobs=None):
         super().__init__()
         self.input_files = input_files
         self.output_dir = output_dir
+        self.jobs = jobs
 
     def run(self):
         try:
-            ref_file = self.input_files[0]
-            common_gene_extract(os.path.abspath(ref_file), self.output_dir, self.log)
-            save_results_dir = os.path.abspath(os.path.join(self.output_dir, "common_gene"))
-
             fasta_dir = os.path.abspath(os.path.join(self.output_dir, 'IGS'))
             info_dir = os.path.join(self.output_dir, 'info')
             os.makedirs(fasta_dir, exist_ok=True)
             os.makedirs(info_dir, exist_ok=True)
-            file_name = ''
+            gb_files = []
             for file_path in self.input_files:
-                if file_path.endswith('gb') or file_path.endswith('gbk'):
-                    file_name = os.path.join(fasta_dir, os.path.basename(file_path).split('.')[0] + '_IGS.fasta')
-                    IGS_extract(file_path, fasta_dir, info_dir, self.log)
+                if is_genbank(file_path):
+                    gb_files.append(os.path.abspath(file_path))
                 else:
                     self.log.emit(f"Skipping non-GenBank file: {file_path}")
 
-            if file_name:
+            # Every genome is parsed and its IGS written in a worker process; the indexes
+            # come back in input order and are shared with the common gene extraction
+            results = run_genome_extraction(gb_files, fasta_dir, info_dir, self.jobs, self.report_progress)
+            index_cache = {}
+            for gb_file, (index, log_lines) in zip(gb_files, results):
+                index_cache[gb_file] = index
+                for line in log_lines:
+                    self.log.emit(line)
+
+            ref_file = self.input_files[0]
+            common_gene_extract(os.path.abspath(ref_file), self.output_dir, self.log, index_cache)
+
+            if gb_files:
+                file_name = os.path.join(fasta_dir, os.path.basename(gb_files[-1]).split('.')[0] + '_IGS.fasta')
                 common_IGS(file_name, self.log)
                 self.log.emit("Extraction completed successfully.")
                 self.log.emit(
@@ -55,129 +66,179 @@ class ExtractionThread(QThread):
         except Exception as e:
             self.log.emit(f"Error occurred during extraction: {str(e)}")
 
-def IGS_extract(input_file, fasta_dir, info_dir, log_signal):
-    for rec in SeqIO.parse(input_file, format='genbank'):
-        genome_length = [[int(part.end)] for part in rec.features[0].location.parts][0][0]
-        my_seq = rec.seq
-        all_feature = []
-        all_info = []
-        for feature in rec.features:
-            if feature.type == 'CDS' or feature.type == 'tRNA' or feature.type == 'rRNA':
-                all_feature.append(feature)
-        for i in range(len(all_feature)):
-            gene_name = all_feature[i].qualifiers['gene'][0]
-            gene_location = all_feature[i].location.parts
-            gene1_exon_info = [[int(part.start), int(part.end), part.strand] for part in gene_location]
-            exon_number = len(gene_location)
-            if exon_number == 1:
-                all_info.append(f"{gene_name}\t{gene1_exon_info[0][0]}\t{gene1_exon_info[0][1]}\t{gene1_exon_info[0][2]}")
-            if exon_number == 2:
-                if gene1_exon_info[0][1] == genome_length:
-                    all_info.append(f"{gene_name}\t{gene1_exon_info[0][0]}\t{gene1_exon_info[0][1]}\t{gene1_exon_info[1][0]}\t{gene1_exon_info[1][1]}\t{gene1_exon_info[0][2]}")
-                else:
-                    all_info.append(f"{gene_name}_1\t{gene1_exon_info[0][0]}\t{gene1_exon_info[0][1]}\t{gene1_exon_info[0][2]}")
-                    all_info.append(f"{gene_name}_2\t{gene1_exon_info[1][0]}\t{gene1_exon_info[1][1]}\t{gene1_exon_info[1][2]}")
-            if exon_number == 3:
-                all_info.append(f"{gene_name}_1\t{gene1_exon_info[0][0]}\t{gene1_exon_info[0][1]}\t{gene1_exon_info[0][2]}")
-                all_info.append(f"{gene_name}_2\t{gene1_exon_info[1][0]}\t{gene1_exon_info[1][1]}\t{gene1_exon_info[1][2]}")
-                all_info.append(f"{gene_name}_3\t{gene1_exon_info[2][0]}\t{gene1_exon_info[2][1]}\t{gene1_exon_info[2][2]}")
-        all_info = list(set(all_info))
-        all_info.sort(key=lambda x: int(x.split('\t')[1]))
-        save_file = os.path.join(info_dir, os.path.basename(input_file).split('.')[0] + '_intergenic_location.txt')
-        save_file_w = open(save_file, 'w')
-        for i in range(len(all_info)-1):
-            info_list = all_info[i].split('\t')
-            next_list = all_info[i+1].split('\t')
-            save_file_w.write(f"{info_list[0]}-{next_list[0]}\t{info_list[-2]}\t{next_list[1]}\n")
-        end_gene_info = all_info[-1].split('\t')
-        start_gene_info = all_info[0].split('\t')
-        if int(end_gene_info[-2]) < int(start_gene_info[1]):
-            save_file_w.write(f"{end_gene_info[0]}-{start_gene_info}[0]\t{end_gene_info[-2]}\t{start_gene_info[1]}\n")
-        else:
-            if int(end_gene_info[2]) < genome_length:
-                save_file_w.write(f"{end_gene_info[0]}-{start_gene_info[0]}\t{end_gene_info[-2]}\t{genome_length}\t0\t\
-                {start_gene_info[1]}\n")
-            else:
-                pass
-        save_file_w.close()
-        all_fasta_file = os.path.join(fasta_dir, os.path.basename(input_file).split('.')[0] + '_IGS.fasta')
-        all_fasta = open(all_fasta_file, 'w')
-        save_results = open(save_file, 'r')
-        result_line = save_results.readline().strip()
-        while result_line:
-            result_line_list = result_line.split('\t')
-            if len(result_line_list) == 3:
-                if int(result_line_list[2]) > int(result_line_list[1]):
-                    all_fasta.write(f">{result_line_list[0]}\n{my_seq[int(result_line_list[1]):int(result_line_list[2])]}\n")
-                    result_line = save_results.readline().strip()
-                else:
-                    log_signal.emit(f"{result_line_list[0]} has overlap!")
-                    result_line = save_results.readline().strip()
+    def report_progress(self, done, total, input_file):
+        self.log.emit(f"[{done}/{total}] Extracted IGS of {os.path.basename(input_file)}")
+        # The per-genome stage is most of the work; the common gene and IGS files take the rest
+        self.progress.emit(int(done / total * 90))
+
+
+class _LogCollector:
+    """Stands in for a log signal in a worker process, keeping the messages for the parent."""
+
+    def __init__(self):
+        self.lines = []
+
+    def emit(self, line):
+        self.lines.append(line)
+
+
+def extract_genome(input_file, fasta_dir, info_dir):
+    """Index one GenBank file and write its IGS files; return the index and the log messages."""
+    log_collector = _LogCollector()
+    index = GenBankIndex(input_file)
+    IGS_extract(input_file, fasta_dir, info_dir, log_collector, index)
+    return index, log_collector.lines
+
+
+def run_genome_extraction(input_files, fasta_dir, info_dir, jobs=None, progress_callback=None):
+    """Run extract_genome over many genomes on a pool of `jobs` processes (all cores when None).
+
+    progress_callback(done, total, input_file) is called as every genome
+    finishes. Results are returned in input order whatever order the
+    workers finish in; an error in any genome is raised once the others are
+    cancelled.
+    """
+    if jobs == 1:
+        results = []
+        for done, input_file in enumerate(input_files, start=1):
+            results.append(extract_genome(input_file, fasta_dir, info_dir))
+            if progress_callback is not None:
+                progress_callback(done, len(input_files), input_file)
+        return results
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(extract_genome, input_file, fasta_dir, info_dir): input_file
+                   for input_file in input_files}
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                results[futures[future]] = future.result()
+                if progress_callback is not None:
+                    progress_callback(done, len(input_files), futures[future])
+        except Exception:
+            for pending in futures:
+                pending.cancel()
+            raise
+    return [results[input_file] for input_file in input_files]
+
+def _IGS_info(record):
+    """Return the gene/exon rows of a record as CPStools writes them: name, starts and ends, strand."""
+    all_info = set()
+    for feature in record.features:
+        if feature.type not in GENE_TYPES:
+            continue
+        gene_name = feature.gene
+        exons = feature.parts
+        if len(exons) == 1:
+            all_info.add((gene_name, exons[0][0], exons[0][1], exons[0][2]))
+        elif len(exons) == 2 and exons[0][1] == record.length:
+            all_info.add((gene_name, exons[0][0], exons[0][1], exons[1][0], exons[1][1], exons[0][2]))
+        elif len(exons) in (2, 3):
+            for number, (start, end, strand) in enumerate(exons, start=1):
+                all_info.add((f"{gene_name}_{number}", start, end, strand))
+    # Ties on the start are broken by the row itself so the order does not depend on set iteration
+    return sorted(all_info, key=lambda info: (info[1], str(info)))
+
+
+def IGS_extract(input_file, fasta_dir, info_dir, log_signal, index=None):
+    """Write the intergenic spacer locations and sequences of one GenBank file.
+
+    The spacer between consecutive genes is written to the info directory
+    and its sequence to <name>_IGS.fasta; the last spacer runs over the
+    origin back to the first gene.
+    """
+    index = GenBankIndex(input_file) if index is None else index
+    for record in index.records:
+        all_info = _IGS_info(record)
+        if not all_info:
+            log_signal.emit(f"No CDS/tRNA/rRNA features found in {input_file}")
+            continue
+        spacers = []
+        for info, next_info in zip(all_info, all_info[1:]):
+            spacers.append((f"{info[0]}-{next_info[0]}", ((info[-2], next_info[1]),)))
+        end_gene_info, start_gene_info = all_info[-1], all_info[0]
+        if end_gene_info[-2] < start_gene_info[1]:
+            spacers.append((f"{end_gene_info[0]}-{start_gene_info[0]}", ((end_gene_info[-2], start_gene_info[1]),)))
+        elif end_gene_info[2] < record.length:
+            spacers.append((f"{end_gene_info[0]}-{start_gene_info[0]}",
+                            ((end_gene_info[-2], record.length), (0, start_gene_info[1]))))
+
+        save_file = os.path.join(info_dir, index.name + '_intergenic_location.txt')
+        with open(save_file, 'w') as save_file_w:
+            for name, parts in spacers:
+                save_file_w.write(name + ''.join(f"\t{start}\t{end}" for start, end in parts) + '\n')
+
+        all_fasta_file = os.path.join(fasta_dir, index.name + '_IGS.fasta')
+        with open(all_fasta_file, 'w') as all_fasta:
+            for name, parts in spacers:
+                if len(parts) == 1 and parts[0][1] <= parts[0][0]:
+                    log_signal.emit(f"{name} has overlap!")
+                    continue
+                all_fasta.write(f">{name}\n{''.join(record.seq[start:end] for start, end in parts)}\n")
+
+def _read_IGS_fasta(fasta_path):
+    """Return the records of an IGS FASTA file as {IGS name: [sequences]}, keeping the file order."""
+    records = {}
+    for rec in SeqIO.parse(fasta_path, format='fasta'):
+        records.setdefault(rec.id, []).append(str(rec.seq))
+    return records
 
-            else:
-                all_fasta.write(f">{result_line_list[0]}\n{my_seq[int(result_line_list[1]):int(result_line_list[2])]}\
-                {my_seq[int(result_line_list[3]):int(result_line_list[4])]}\n")
-                result_line = save_results.readline().strip()
-        all_fasta.close()
 
 def common_IGS(input_file, log_signal):
-    all_common = []
-    for rec in SeqIO.parse(input_file, format='fasta'):
-        all_common.append(rec.id)
+    """Write one unaligned FASTA per IGS shared by every *_IGS.fasta file next to input_file.
+
+    Every FASTA file is read once; the IGS names of input_file that occur
+    (ignoring case) in all files are written to cp_sort_IGS.txt in their
+    input_file order, and each common IGS file is then written straight
+    from the loaded records.
+    """
     work_dir = os.path.dirname(input_file)
+    all_IGS = {}
     for fasta_file in os.listdir(work_dir):
-        if fasta_file:
-            single_IGS = []
-            if fasta_file.split('.')[1] == 'fasta':
-                fasta_path = os.path.join(work_dir, fasta_file)
-                log_signal.emit(f"The input intergenic fasta file is {fasta_path}")
-                for rec2 in SeqIO.parse(fasta_path, format='fasta'):
-                    single_IGS.append(rec2.id)
-                for name1_index in range(len(all_common)-1, -1, -1):
-                    if all_common[name1_index].lower() not in [single_name.lower() for single_name in single_IGS]:
-                        all_common.remove(all_common[name1_index])
-    cp_sort_IGS_file = open(os.path.join(work_dir, 'cp_sort_IGS.txt'), 'w')
-    for i in all_common:
-        cp_sort_IGS_file.write(f"{i}\n")
-    cp_sort_IGS_file.close()
+        fasta_path = os.path.join(work_dir, fasta_file)
+        name_parts = fasta_file.split('.')
+        if os.path.isfile(fasta_path) and len(name_parts) > 1 and name_parts[1] == 'fasta':
+            log_signal.emit(f"The input intergenic fasta file is {fasta_path}")
+            all_IGS[fasta_file] = _read_IGS_fasta(fasta_path)
+
+    reference = all_IGS.get(os.path.basename(input_file))
+    if reference is None:
+        reference = _read_IGS_fasta(input_file)
+    common_names = set.intersection(*[{name.lower() for name in records} for records in all_IGS.values()]) \
+        if all_IGS else set()
+    all_common = [name for name in reference if name.lower() in common_names]
+
+    with open(os.path.join(work_dir, 'cp_sort_IGS.txt'), 'w') as cp_sort_IGS_file:
+        for i in all_common:
+            cp_sort_IGS_file.write(f"{i}\n")
     log_signal.emit(f"The intergenic fasta number is {len(all_common)}")
     save_dir = os.path.join(os.path.dirname(input_file), 'unalign_common_IGS')
-    os.mkdir(save_dir)
+    os.makedirs(save_dir, exist_ok=True)
     for common_name in all_common:
-        save_file_path = os.path.join(save_dir, common_name + '.fasta')
-        save_file = open(save_file_path, 'w')
-        for fasta_file in os.listdir(work_dir):
-            fasta_path = os.path.join(work_dir, fasta_file)
-            if os.path.isfile(fasta_path):
-                if fasta_path.split('.')[1] == 'fasta':
-                    for rec in SeqIO.parse(fasta_path, format='fasta'):
-                        if rec.id == common_name:
-                            save_file.write(f">{fasta_file.split('_IGS')[0]}\n{rec.seq}\n")
-        save_file.close()
-
-def common_gene_extract(input_file, output_dir, log_signal):
+        with open(os.path.join(save_dir, common_name + '.fasta'), 'w') as save_file:
+            for fasta_file, records in all_IGS.items():
+                species = fasta_file.split('_IGS')[0]
+                for seq in records.get(common_name, []):
+                    save_file.write(f">{species}\n{seq}\n")
+
+def common_gene_extract(input_file, output_dir, log_signal, index_cache=None):
+    """Write one FASTA per gene shared by every GenBank file in the directory of input_file.
+
+    Every genome is parsed once into a GenBankIndex (reused from index_cache
+    when given), so the per-gene files are written from lookups instead of
+    re-parsing each genome for each gene.
+    """
     work_dir = os.path.dirname(input_file)
-    all_gene = []
-    for rec in SeqIO.parse(input_file, format='genbank'):
-        for feature in rec.features:
-            if feature.type == 'CDS' or feature.type == 'tRNA' or feature.type == 'rRNA':
-                if feature.qualifiers['gene'][0] not in all_gene:
-                    all_gene.append(feature.qualifiers['gene'][0])
+    gb_files = [os.path.join(work_dir, files) for files in os.listdir(work_dir) if is_genbank(files)]
+    indexes = index_genbank_files([input_file] + gb_files, index_cache)
+    all_gene = indexes[input_file].gene_names()
     log_signal.emit(f"Total gene number in reference file: {len(all_gene)}")
-    for files in os.listdir(work_dir):
-        if files.endswith('gb') or files.endswith('gbk'):
-            single_gene = []
-            gb_file = os.path.join(work_dir, files)
-            log_signal.emit(f"Processing file: {gb_file}")
-            for rec in SeqIO.parse(gb_file, format='genbank'):
-                for feature in rec.features:
-                    if feature.type == 'CDS' or feature.type == 'tRNA' or feature.type == 'rRNA':
-                        if feature.qualifiers['gene'][0] not in single_gene:
-                            single_gene.append(feature.qualifiers['gene'][0])
-                log_signal.emit(f"Total gene number in file {files}: {len(single_gene)}")
-            for gene_index in range(len(all_gene)-1, -1, -1):
-                if all_gene[gene_index].lower() not in [y.lower() for y in single_gene]:
-                    all_gene.remove(all_gene[gene_index])
+    for gb_file in gb_files:
+        log_signal.emit(f"Processing file: {gb_file}")
+        single_gene = indexes[gb_file].gene_names()
+        log_signal.emit(f"Total gene number in file {os.path.basename(gb_file)}: {len(single_gene)}")
+        single_gene = {gene_name.lower() for gene_name in single_gene}
+        all_gene = [gene_name for gene_name in all_gene if gene_name.lower() in single_gene]
     log_signal.emit(f"Total common gene number: {len(all_gene)}")
     gene_name_file = os.path.join(output_dir, 'gene_cp_sort.txt')
     with open(gene_name_file, 'w') as ff:
@@ -194,24 +255,18 @@ def common_gene_extract(input_file, output_dir, log_signal):
             log_signal.emit("Overwriting existing directory.")
     os.makedirs(save_dir, exist_ok=True)
     for gene_name in all_gene:
-        file_name = str(gene_name) + '.fasta'
-        file_path = os.path.join(save_dir, file_name)
+        file_path = os.path.join(save_dir, str(gene_name) + '.fasta')
         with open(file_path, 'w') as fasta_file:
-            for gb_file in os.listdir(work_dir):
-                if gb_file.endswith('gb') or gb_file.endswith('gbk'):
-                    gb_file_path = os.path.join(work_dir, gb_file)
-                    fasta_file.write(f">{gb_file.split('.')[0]}\n")
-                    for rec in SeqIO.parse(gb_file_path, format='genbank'):
-                        my_seqs = []
-                        for feature in rec.features:
-                            if feature.type == 'CDS' or feature.type == 'tRNA' or feature.type == 'rRNA':
-                                if feature.qualifiers['gene'][0].lower() == gene_name.lower():
-                                    my_seqs.append(feature.extract(rec.seq))
-                        if len(my_seqs) == 1:
-                            fasta_file.write(f"{my_seqs[0]}\n")
-                        if len(my_seqs) == 2:
-                            my_seqs.remove(my_seqs[0]) if len(my_seqs[0]) <= len(my_seqs[1]) else my_seqs.remove(my_seqs[1])
-                            fasta_file.write(f"{my_seqs[0]}\n")
+            for gb_file in gb_files:
+                index = indexes[gb_file]
+                fasta_file.write(f">{index.name}\n")
+                for record in index.records:
+                    my_seqs = index.gene_sequences(record, gene_name)
+                    if len(my_seqs) == 1:
+                        fasta_file.write(f"{my_seqs[0]}\n")
+                    if len(my_seqs) == 2:
+                        # A gene annotated twice (e.g. in both inverted repeats) keeps its longer copy
+                        fasta_file.write(f"{my_seqs[1] if len(my_seqs[0]) <= len(my_seqs[1]) else my_seqs[0]}\n")
 
 class commongeneAndIGSExtractApp(QMainWindow):
     def __init__(self):
@@ -273,6 +328,17 @@ class commongeneAndIGSExtractApp(QMainWindow):
         self.output_logs_textedit = QTextEdit()
         main_layout.addWidget(self.output_logs_textedit)
 
+        # Number of genomes processed at once
+        jobs_layout = QHBoxLayout()
+        main_layout.addLayout(jobs_layout)
+        jobs_layout.addWidget(QLabel('Processes:'))
+        self.jobs_spinbox = QSpinBox()
+        self.jobs_spinbox.setMinimum(1)
+        self.jobs_spinbox.setMaximum(os.cpu_count() or 1)
+        self.jobs_spinbox.setValue(os.cpu_count() or 1)
+        jobs_layout.addWidget(self.jobs_spinbox)
+        jobs_layout.addStretch()
+
         # Start Extraction Button
         self.start_extraction_button = QPushButton('Start Extraction')
         self.start_extraction_button.clicked.connect(self.startExtraction)
@@ -302,7 +368,7 @@ class commongeneAndIGSExtractApp(QMainWindow):
         self.start_extraction_button.setEnabled(False)
         self.progress_bar.setValue(0)
 
-        self.thread = ExtractionThread(input_files, output_dir)
+        self.thread = ExtractionThread(input_files, output_dir, self.jobs_spinbox.value())
         self.thread.progress.connect(self.progress_bar.setValue)
         self.thread.log.connect(self.output_logs_textedit.append)
         self.thread.finished.connect(self.extractionFinished)
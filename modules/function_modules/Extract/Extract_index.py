@@ -0,0 +1,96 @@
+'''
+Copyright 2024 JunqiaoZhu Zhejiang Sci-Tech University
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+from collections import namedtuple
+from Bio import SeqIO
+
+# Feature types treated as genes by the gene and IGS extraction
+GENE_TYPES = ('CDS', 'tRNA', 'rRNA')
+
+# One annotated feature; parts holds its (start, end, strand) pieces with
+# 0-based, end-exclusive coordinates in the order they are joined
+Feature = namedtuple('Feature', ['type', 'gene', 'locus_tag', 'parts'])
+
+# One GenBank record. length is the end of the first feature (the source
+# feature), as the extraction tools have always read it, and genes maps the
+# lower-case name of every CDS/tRNA/rRNA to its features in file order
+GenBankRecord = namedtuple('GenBankRecord', ['id', 'seq', 'length', 'features', 'genes'])
+
+_COMPLEMENT = str.maketrans('ACGTUMRWSYKVHDBNacgtumrwsykvhdbn', 'TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn')
+
+
+def is_genbank(file_name):
+    return file_name.endswith('gb') or file_name.endswith('gbk')
+
+
+def reverse_complement(seq):
+    return seq.translate(_COMPLEMENT)[::-1]
+
+
+def extract_parts(seq, parts):
+    """Return the sequence of a feature, joining its parts and reverse-complementing minus-strand ones."""
+    return ''.join(reverse_complement(seq[start:end]) if strand == -1 else seq[start:end]
+                   for start, end, strand in parts)
+
+
+class GenBankIndex:
+    """The features and sequence of every record of a GenBank file, parsed once.
+
+    Extraction tools query the index instead of re-parsing the file for
+    every gene they write.
+    """
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.name = os.path.basename(input_file).split('.')[0]
+        self.records = [self._index_record(rec) for rec in SeqIO.parse(input_file, format='genbank')]
+
+    @staticmethod
+    def _index_record(rec):
+        features, genes = [], {}
+        for feature in rec.features:
+            parts = tuple((int(part.start), int(part.end), part.strand) for part in feature.location.parts)
+            gene = feature.qualifiers['gene'][0] if 'gene' in feature.qualifiers else None
+            locus_tag = feature.qualifiers['locus_tag'][0] if 'locus_tag' in feature.qualifiers else None
+            indexed = Feature(feature.type, gene, locus_tag, parts)
+            features.append(indexed)
+            if feature.type in GENE_TYPES and gene is not None:
+                genes.setdefault(gene.lower(), []).append(indexed)
+        length = features[0].parts[0][1] if features else len(rec.seq)
+        return GenBankRecord(rec.id, str(rec.seq), length, features, genes)
+
+    def gene_names(self):
+        """Return the CDS/tRNA/rRNA gene names of the file, each once, in file order."""
+        names = {}
+        for record in self.records:
+            for feature in record.features:
+                if feature.type in GENE_TYPES and feature.gene is not None:
+                    names.setdefault(feature.gene, None)
+        return list(names)
+
+    def gene_sequences(self, record, gene_name):
+        """Return the sequences of the CDS/tRNA/rRNA features named gene_name (any case) in a record."""
+        return [extract_parts(record.seq, feature.parts) for feature in record.genes.get(gene_name.lower(), [])]
+
+
+def index_genbank_files(input_files, cache=None):
+    """Return {input_file: GenBankIndex}, parsing only the files not already in cache."""
+    cache = {} if cache is None else cache
+    for input_file in input_files:
+        if input_file not in cache:
+            cache[input_file] = GenBankIndex(input_file)
+    return {input_file: cache[input_file] for input_file in input_files}
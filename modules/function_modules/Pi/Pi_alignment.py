@@ -0,0 +1,182 @@
+'''
+Copyright 2024 JunqiaoZhu Zhejiang Sci-Tech University
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+import json
+import hashlib
+from collections import namedtuple
+import numpy as np
+from modules.function_modules.Pi.Pi_engine import gapped_columns
+
+# Parsed alignments are cached here, one entry per input file and parse mode.
+# An entry is overwritten when its file changes, and the least recently used
+# entries are evicted once the cache holds more than CACHE_MAX_BYTES
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cpgana', 'alignment_cache')
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+_CACHE_SUFFIXES = ('.json', '.matrix.npy', '.gaps.npy')
+
+Alignment = namedtuple('Alignment', ['ids', 'matrix', 'gaps'])
+
+# Upper-case every base and read N as a gap while the file is parsed
+_PARSE_TABLE = bytearray(range(256))
+for _code in range(ord('a'), ord('z') + 1):
+    _PARSE_TABLE[_code] = _code - 32
+_PARSE_TABLE[ord('N')] = _PARSE_TABLE[ord('n')] = ord('-')
+_PARSE_TABLE = bytes(_PARSE_TABLE)
+_RAW_TABLE = bytes(range(256))
+_WHITESPACE = b' \t\r\n'
+
+
+def _scan_lengths(infile):
+    """Return the sequence IDs and the parsed length of every record."""
+    ids, lengths = [], []
+    with open(infile, 'rb') as f:
+        for line in f:
+            if line.startswith(b'>'):
+                ids.append(line[1:].strip().decode(errors='replace'))
+                lengths.append(0)
+            elif ids:
+                lengths[-1] += len(line.translate(None, _WHITESPACE))
+    return ids, lengths
+
+
+def read_alignment(infile, normalize=True):
+    """Parse an aligned FASTA file into its IDs and a (sequences x columns) uint8 matrix.
+
+    The file is read line by line twice: once to size the matrix and once to fill
+    it, so no intermediate per-base Python objects are created. With normalize
+    the bases are upper-cased and N is read as a gap; otherwise they are kept as-is.
+    """
+    table = _PARSE_TABLE if normalize else _RAW_TABLE
+    ids, lengths = _scan_lengths(infile)
+    aln_len = lengths[0] if lengths else 0
+    for seq_id, length in zip(ids, lengths):
+        if length != aln_len:
+            raise ValueError(f"Sequence '{seq_id}' has length {length}, expected aligned length {aln_len}")
+
+    aln = np.empty((len(ids), aln_len), dtype=np.uint8)
+    row, col = -1, 0
+    with open(infile, 'rb') as f:
+        for line in f:
+            if line.startswith(b'>'):
+                row, col = row + 1, 0
+            elif row >= 0:
+                bases = line.translate(table, _WHITESPACE)
+                aln[row, col:col + len(bases)] = np.frombuffer(bases, dtype=np.uint8)
+                col += len(bases)
+    return ids, aln
+
+
+def _cache_paths(infile, normalize):
+    key = hashlib.sha1(f"{os.path.abspath(infile)}|{int(normalize)}".encode()).hexdigest()
+    base = os.path.join(CACHE_DIR, key)
+    return tuple(base + suffix for suffix in _CACHE_SUFFIXES)
+
+
+def _load_cached(infile, normalize, stat):
+    meta_path, matrix_path, gaps_path = _cache_paths(infile, normalize)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['mtime_ns'] != stat.st_mtime_ns or meta['size'] != stat.st_size:
+            return None
+        alignment = Alignment(meta['ids'], np.load(matrix_path, mmap_mode='r'), np.load(gaps_path))
+    except (OSError, ValueError, KeyError):
+        return None
+    try:
+        os.utime(meta_path)  # Mark the entry as recently used for eviction
+    except OSError:
+        pass
+    return alignment
+
+
+def prune_cache(max_bytes=CACHE_MAX_BYTES, keep=()):
+    """Delete the least recently used cache entries until at most max_bytes remain.
+
+    Only file sizes and times are read, so this is cheap enough to run on
+    every save. The entry whose base path is in keep is never deleted.
+    """
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    entries = {}
+    for name in names:
+        for suffix in _CACHE_SUFFIXES:
+            if name.endswith(suffix):
+                entries.setdefault(os.path.join(CACHE_DIR, name[:-len(suffix)]), []).append(
+                    os.path.join(CACHE_DIR, name))
+                break
+
+    sized, total = [], 0
+    for base, paths in entries.items():
+        try:
+            stats = [os.stat(path) for path in paths]
+        except OSError:
+            continue  # Being replaced or removed by another run
+        size = sum(stat.st_size for stat in stats)
+        total += size
+        if base not in keep:
+            sized.append((max(stat.st_mtime for stat in stats), size, paths))
+
+    for _, size, paths in sorted(sized):
+        if total <= max_bytes:
+            break
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # In use or already gone; it is retried on the next save
+        total -= size
+
+
+def _save_cached(infile, normalize, stat, alignment):
+    meta_path, matrix_path, gaps_path = _cache_paths(infile, normalize)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write to temporary names first so a concurrent reader never sees half an entry
+        for path, array in ((matrix_path, alignment.matrix), (gaps_path, alignment.gaps)):
+            with open(path + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(path + '.tmp', path)
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'infile': os.path.abspath(infile), 'mtime_ns': stat.st_mtime_ns,
+                       'size': stat.st_size, 'ids': alignment.ids}, f)
+        os.replace(meta_path + '.tmp', meta_path)
+    except OSError:
+        return  # Caching is best effort; a read-only home directory must not break a run
+    prune_cache(keep=(os.path.splitext(meta_path)[0],))
+
+
+def load_alignment(infile, normalize=True, use_cache=True):
+    """Return the IDs, encoded matrix and gapped-column mask of an aligned FASTA file.
+
+    Results are cached on disk keyed by the file path, modification time and
+    size, so repeated runs over an unchanged alignment skip parsing and map the
+    cached matrix straight from disk. Pass use_cache=False to neither read nor
+    write the cache.
+    """
+    stat = os.stat(infile)
+    if use_cache:
+        alignment = _load_cached(infile, normalize, stat)
+        if alignment is not None:
+            return alignment
+
+    ids, matrix = read_alignment(infile, normalize)
+    alignment = Alignment(ids, matrix, gapped_columns(matrix))
+    if use_cache:
+        _save_cached(infile, normalize, stat, alignment)
+    return alignment
@@ -8,9 +8,171 @@ site:   https://blog.csdn.net/weixin_43362619/article/details/107239012?spm=1001
 import sys
 import os
 import time
-from PyQt5.QtCore import Qt
+import numpy as np
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QFont
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QLabel, QLineEdit, QPushButton, QTextEdit, QVBoxLayout, QHBoxLayout, QFileDialog, QMessageBox
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QLabel, QLineEdit, QPushButton, QTextEdit, QVBoxLayout, QHBoxLayout, QFileDialog, QMessageBox, QCheckBox, QProgressBar
+from modules.function_modules.Pi.Pi_alignment import load_alignment
+from modules.function_modules.Pi.Pi_engine import check_sites, cumulative_sites, window_sums
+from modules.function_modules.Pi.Pi_packed import PackedAlignment
+
+# Result lines reach the text area in blocks of LOG_BATCH_LINES, and only the
+# first MAX_DISPLAYED_LINES of a run are shown; the result files are always complete
+LOG_BATCH_LINES = 500
+MAX_DISPLAYED_LINES = 5000
+
+# Progress reached after loading the alignment, checking its sites and counting
+# the per-column differences; the windows fill the rest of the bar
+LOADED_PROGRESS, CHECKED_PROGRESS, DIFFS_PROGRESS = 10, 20, 30
+
+class PiWindowThread(QThread):
+    progress = pyqtSignal(int)
+    log = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+    def __init__(self, infile, window, step, sweep_pairs, combined, output_dir, use_cache=True):
+        super().__init__()
+        self.infile = infile
+        self.window = window
+        self.step = step
+        self.sweep_pairs = sweep_pairs
+        self.combined = combined
+        self.output_dir = output_dir
+        self.use_cache = use_cache
+        self.pending_lines = []
+        self.displayed_lines = 0
+
+    def run(self):
+        start_time = time.time()
+        try:
+            finished = self.calculate()
+        except Exception as e:
+            self.flush_lines()
+            self.error.emit(str(e))
+            return
+        self.flush_lines()
+        if finished:
+            self.log.emit(f"Done. Total elapsed time: {time.time() - start_time:.2f}s")
+        else:
+            self.log.emit("Calculation cancelled by user.")
+
+    def show_lines(self, lines):
+        """Queue lines for the text area, sending them in batches up to the display cap."""
+        room = MAX_DISPLAYED_LINES - self.displayed_lines
+        if room <= 0:
+            return
+        self.pending_lines.extend(lines[:room])
+        self.displayed_lines += min(len(lines), room)
+        if self.displayed_lines == MAX_DISPLAYED_LINES:
+            self.pending_lines.append(f"... display limited to {MAX_DISPLAYED_LINES} lines, "
+                                      f"see {os.path.abspath(self.output_dir)} for the full results")
+        if len(self.pending_lines) >= LOG_BATCH_LINES or self.displayed_lines == MAX_DISPLAYED_LINES:
+            self.flush_lines()
+
+    def flush_lines(self):
+        if self.pending_lines:
+            self.log.emit('\n'.join(self.pending_lines))
+            self.pending_lines = []
+
+    def calculate(self):
+        alignment = load_alignment(self.infile, use_cache=self.use_cache)
+        if not alignment.ids:
+            self.show_lines(["No sequences found in input file!"])
+            return True
+        if self.isInterruptionRequested():
+            return False
+        self.progress.emit(LOADED_PROGRESS)
+        all_seq = alignment.matrix
+        aln_len = len(all_seq[0])
+
+        # The conserved columns are indexed through the cached gap mask rather than
+        # copied out of the alignment
+        check_sites(all_seq)
+        for_old_pos = np.flatnonzero(~alignment.gaps).astype(np.int32)
+        conserved_len = len(for_old_pos)
+
+        # From here on the sites are held two per byte and the byte matrix is
+        # released, halving the memory of 1,000-taxon alignments. N was read as
+        # a gap by load_alignment and is packed as one too.
+        packed = PackedAlignment.from_matrix(all_seq, n_as_gap=True)
+        del alignment, all_seq
+        if self.isInterruptionRequested():
+            return False
+        self.progress.emit(CHECKED_PROGRESS)
+
+        requested = self.sweep_pairs if self.sweep_pairs else [(self.window, self.step)]
+        pairs = []
+        for window, step in requested:
+            window = window if window > 0 else aln_len
+            step = step if step > 0 else aln_len
+            if window > aln_len:
+                self.show_lines(["Warning: window must be less than alignment sequence length"])
+                return True
+            if window > conserved_len:
+                window = conserved_len
+            if step > conserved_len:
+                step = conserved_len
+            if window < step:
+                self.show_lines(["Warning: window must be larger than step"])
+                return True
+            pairs.append((window, step))
+
+        # Per-column differences and their prefix sums are shared by every window/step pair
+        site_diffs = packed.column_diffs()[for_old_pos]
+        cum_sites = cumulative_sites(site_diffs)
+        if self.isInterruptionRequested():
+            return False
+        self.progress.emit(DIFFS_PROGRESS)
+        all_pi_info = computer_pi_with_bin(packed, conserved_len, conserved_len, for_old_pos, site_diffs, cum_sites)
+        all_pi, all_S = map(float, all_pi_info[0].split()[2:4])
+
+        header = [f"#infile: {os.path.abspath(self.infile)}",
+                  f"#seq number: {packed.shape[0]}",
+                  f"#aln length: {aln_len}",
+                  f"#conserved length: {conserved_len}"]
+        if self.sweep_pairs:
+            header.append(f"#window/step pairs: {', '.join(f'{w}/{s}' for w, s in pairs)}")
+        else:
+            header.append(f"#window length: {pairs[0][0]}")
+            header.append(f"#step size: {pairs[0][1]}")
+        header.append(f"#Nucleotide diversity, Pi: {all_pi}")
+        header.append(f"#Number of polymorphic (segregating) sites, S: {all_S}")
+        header.append("=" * 35)
+        self.show_lines(header)
+
+        total_windows = sum(int((conserved_len - window) / step) + 1 for window, step in pairs)
+        done_windows = 0
+        combined_lines = ["Window\tStep\tStart\tEnd\tMidpoint\tPi\tS"]
+        for window, step in pairs:
+            if self.isInterruptionRequested():
+                return False
+            pi_info = computer_pi_with_bin(packed, window, step, for_old_pos, site_diffs, cum_sites)
+            if self.sweep_pairs:
+                self.show_lines([f"#window length: {window}\t#step size: {step}"])
+            output_lines = ["Start\tEnd\tMidpoint\tPi\tS"]
+            for line in pi_info:
+                parts = line.split()
+                start_end = parts[0].split('-')
+                start, end = start_end[0], start_end[1]
+                midpoint, pi, s = parts[1], parts[2], parts[3]
+                output_lines.append(f"{start}\t{end}\t{midpoint}\t{pi}\t{s}")
+                combined_lines.append(f"{window}\t{step}\t{start}\t{end}\t{midpoint}\t{pi}\t{s}")
+            self.show_lines(output_lines)
+            self.show_lines(["=" * 35])
+
+            # A sweep writes one table per pair unless the combined long-format table is requested
+            if not (self.sweep_pairs and self.combined):
+                output_file = f'pi_results_w{window}_s{step}.txt' if self.sweep_pairs else 'pi_results.txt'
+                with open(os.path.join(self.output_dir, output_file), 'w') as f:
+                    f.write('\n'.join(output_lines))
+            done_windows += len(pi_info)
+            self.progress.emit(DIFFS_PROGRESS + int(done_windows / total_windows * (100 - DIFFS_PROGRESS)))
+
+        if self.sweep_pairs and self.combined:
+            with open(os.path.join(self.output_dir, 'pi_sweep_results.txt'), 'w') as f:
+                f.write('\n'.join(combined_lines))
+        return True
+
 class PiCalculateApp(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -29,11 +191,21 @@ class PiCalculateApp(QMainWindow):
         self.window_input = QLineEdit()
         self.step_label = QLabel('Step Size:')
         self.step_input = QLineEdit()
+        self.sweep_label = QLabel('Sweep (window,step; ...):')
+        self.sweep_input = QLineEdit()
+        self.sweep_input.setPlaceholderText('e.g. 600,200; 800,200; 1000,500')
+        self.combined_checkbox = QCheckBox('Combined table')
         self.output_label = QLabel('Output Directory:')
         self.output_input = QLineEdit()
         self.browse_output_button = QPushButton('Browse')
+        self.cache_checkbox = QCheckBox('Cache parsed alignment')
+        self.cache_checkbox.setChecked(True)
         self.run_button = QPushButton('Run')
+        self.cancel_button = QPushButton('Cancel')
+        self.cancel_button.setEnabled(False)
+        self.progress_bar = QProgressBar()
         self.output_text = QTextEdit()
+        self.worker = None
 
         # Layouts
         main_layout = QVBoxLayout()
@@ -58,15 +230,27 @@ class PiCalculateApp(QMainWindow):
         size_layout.addWidget(self.step_input)
         main_layout.addLayout(size_layout)
 
+        # Window/Step Sweep Row
+        sweep_layout = QHBoxLayout()
+        sweep_layout.addWidget(self.sweep_label)
+        sweep_layout.addWidget(self.sweep_input)
+        sweep_layout.addWidget(self.combined_checkbox)
+        main_layout.addLayout(sweep_layout)
+
         # Output Directory Row
         output_layout = QHBoxLayout()
         output_layout.addWidget(self.output_label)
         output_layout.addWidget(self.output_input)
         output_layout.addWidget(self.browse_output_button)
+        output_layout.addWidget(self.cache_checkbox)
         main_layout.addLayout(output_layout)
 
-        # Run Button
-        main_layout.addWidget(self.run_button)
+        # Run and Cancel Buttons
+        run_layout = QHBoxLayout()
+        run_layout.addWidget(self.run_button)
+        run_layout.addWidget(self.cancel_button)
+        main_layout.addLayout(run_layout)
+        main_layout.addWidget(self.progress_bar)
 
         # Output Text Area
         main_layout.addWidget(self.output_text)
@@ -75,6 +259,7 @@ class PiCalculateApp(QMainWindow):
         self.browse_button.clicked.connect(self.browse_files)
         self.browse_output_button.clicked.connect(self.browse_output_directory)
         self.run_button.clicked.connect(self.run_calculation)
+        self.cancel_button.clicked.connect(self.cancel_calculation)
 
     def browse_files(self):
         options = QFileDialog.Options()
@@ -102,135 +287,68 @@ class PiCalculateApp(QMainWindow):
             self.output_text.append("Output directory does not exist!")
             return
 
-        start_time = time.time()
-        all_seq = get_aln_seq(infile)
-        window = window if window > 0 else len(all_seq[0])
-        step = step if step > 0 else len(all_seq[0])
-
-        if window > len(all_seq[0]):
-            self.output_text.append("Warning: window must be less than alignment sequence length")
-            return
-
-        conserved_site, for_old_pos = get_conserved_site(all_seq)
-        conserved_len = len(conserved_site[0])
-
-        if window > conserved_len:
-            window = conserved_len
-        if step > conserved_len:
-            step = conserved_len
-        if window < step:
-            self.output_text.append("Warning: window must be larger than step")
+        try:
+            sweep_pairs = parse_window_pairs(self.sweep_input.text())
+        except ValueError as e:
+            self.output_text.append(f"Warning: {e}")
             return
-        else:
-            all_pi_info = computer_pi_with_bin(conserved_site, conserved_len, conserved_len, for_old_pos)
-            all_pi, all_S = map(float, all_pi_info[0].split()[2:4])
-
-            self.output_text.append(f"#infile: {os.path.abspath(infile)}")
-            self.output_text.append(f"#seq number: {len(all_seq)}")
-            self.output_text.append(f"#aln length: {len(all_seq[0])}")
-            self.output_text.append(f"#conserved length: {conserved_len}")
-            self.output_text.append(f"#window length: {window}")
-            self.output_text.append(f"#step size: {step}")
-            self.output_text.append(f"#Nucleotide diversity, Pi: {all_pi}")
-            self.output_text.append(f"#Number of polymorphic (segregating) sites, S: {all_S}")
-            self.output_text.append("=" * 35)
-
-            pi_info = computer_pi_with_bin(conserved_site, window, step, for_old_pos)
-            self.output_text.append("Start\tEnd\tMidpoint\tPi\tS")
-            output_lines = ["Start\tEnd\tMidpoint\tPi\tS"]
-            for line in pi_info:
-                parts = line.split()
-                start_end = parts[0].split('-')
-                start, end = start_end[0], start_end[1]
-                midpoint, pi, s = parts[1], parts[2], parts[3]
-                self.output_text.append(f"{start}\t{end}\t{midpoint}\t{pi}\t{s}")
-                output_lines.append(f"{start}\t{end}\t{midpoint}\t{pi}\t{s}")
 
-            with open(os.path.join(output_dir, 'pi_results.txt'), 'w') as f:
-                f.write('\n'.join(output_lines))
-
-            self.output_text.append("=" * 35)
-            self.output_text.append(f"Done. Total elapsed time: {time.time() - start_time:.2f}s")
-
-def get_aln_seq(infile):
-    with open(infile, 'r') as f:
-        data = f.read().split('>')[1:]
-        all_seq = []
-        for entry in data:
-            lines = entry.split('\n')
-            seq = ''.join(lines[1:]).replace('\n', '').replace(' ', '').upper()
-            seq = seq.replace('N', '-')
-            all_seq.append(list(seq))
-    return all_seq
-
-def compute_diff_site(sites):
-    s = 0
-    for i in range(len(sites) - 1):
-        for j in range(i + 1, len(sites)):
-            if sites[i] != sites[j]:
-                s += 1
-    return s
-
-def get_conserved_site(all_seq):
-    sample_nu = len(all_seq)
-    conserved_site = []
-    for_old_pos = {}
-    i2 = 0
-
-    for i in range(len(all_seq[0])):
-        indel_flag = 0
-        for j in range(sample_nu):
-            if all_seq[j][i] not in "ATGC-":
-                raise ValueError(f"Some site is not ATGC in conserved site: {all_seq[j][i]}")
-            if all_seq[j][i] == '-':
-                indel_flag = 1
-
-        if indel_flag == 0:
-            for k in range(sample_nu):
-                if len(conserved_site) <= k:
-                    conserved_site.append([])
-                conserved_site[k].append(all_seq[k][i])
-            for_old_pos[i2] = i
-        else:
-            for_old_pos[i2] = i
-            i2 -= 1
-        i2 += 1
-    return conserved_site, for_old_pos
-
-def get_conserved_sites_pi(all_seq):
-    sample_nu = len(all_seq)
-    sum_diff_sites = 0
-    len_seq = len(all_seq[0])
-    nu_mutations = 0
+        self.run_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.progress_bar.setValue(0)
+
+        self.worker = PiWindowThread(infile, window, step, sweep_pairs, self.combined_checkbox.isChecked(), output_dir,
+                                     self.cache_checkbox.isChecked())
+        self.worker.progress.connect(self.progress_bar.setValue)
+        self.worker.log.connect(self.output_text.append)
+        self.worker.error.connect(self.calculation_failed)
+        self.worker.finished.connect(self.calculation_finished)
+        self.worker.start()
+
+    def cancel_calculation(self):
+        if self.worker is not None and self.worker.isRunning():
+            self.cancel_button.setEnabled(False)
+            self.worker.requestInterruption()
+
+    def calculation_failed(self, message):
+        QMessageBox.critical(self, 'Error', f"Error calculating Pi values: {message}")
+
+    def calculation_finished(self):
+        self.run_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+
+def parse_window_pairs(text):
+    """Parse a sweep specification such as '600,200; 800,200' into (window, step) pairs."""
+    pairs = []
+    for item in text.replace('\n', ';').split(';'):
+        if not item.strip():
+            continue
+        fields = item.replace(' ', '').split(',')
+        if len(fields) != 2 or not all(field.isdigit() for field in fields):
+            raise ValueError(f"invalid window/step pair '{item.strip()}', expected window,step")
+        pairs.append((int(fields[0]), int(fields[1])))
+    return pairs
+
+def computer_pi_with_bin(all_seq, window, step, for_old_pos, site_diffs, cum_sites):
+    sample_nu = all_seq.shape[0]
 
     if sample_nu <= 1:
         raise ValueError("Sample number is less than 2")
 
-    for i in range(len_seq):
-        sites = [all_seq[j][i] for j in range(sample_nu)]
-        diff_sites = compute_diff_site(sites)
-        sum_diff_sites += diff_sites
-        if diff_sites:
-            nu_mutations += 1
+    # Per-column differences are computed once by the caller; every window is a prefix-sum lookup
+    cum_diffs, cum_segregating = cum_sites
+    starts, sum_diffs, nu_mutations = window_sums(cum_diffs, cum_segregating, window, step)
 
     di = sample_nu * (sample_nu - 1) / 2
-    pi = sum_diff_sites / di / len_seq
-    return pi, nu_mutations
-
-def computer_pi_with_bin(all_seq, window, step, for_old_pos):
-    len_seq = len(all_seq[0])
-    loop = int((len_seq - window) / step)
     info = []
-
-    for d in range(loop + 1):
-        bin_site = [[all_seq[i][d * step + j] for j in range(window)] for i in range(len(all_seq))]
-        start_new = d * step + 1
+    for start, sum_diff_sites, nu in zip(starts.tolist(), sum_diffs.tolist(), nu_mutations.tolist()):
+        start_new = start + 1
         end_new = start_new + window - 1
         mid_new = (end_new + start_new) // 2
-        mid = for_old_pos[mid_new - 1] + 1
+        mid = int(for_old_pos[mid_new - 1]) + 1
 
-        pi, nu_mutations = get_conserved_sites_pi(bin_site)
-        info.append(f"{start_new}-{end_new}\t{mid}\t{pi:.5f}\t{nu_mutations}")
+        pi = sum_diff_sites / di / window
+        info.append(f"{start_new}-{end_new}\t{mid}\t{pi:.5f}\t{nu}")
 
     return info
 
@@ -9,10 +9,41 @@ site:   https://github.com/Xwb7533/CPStools
 
 import os
 import sys
-from PyQt5.QtCore import Qt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QFont
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QFileDialog, QMessageBox, QComboBox
-from Bio import SeqIO
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, QFileDialog, QMessageBox, QComboBox, QProgressBar, QSpinBox, QCheckBox
+from modules.function_modules.Pi.Pi_alignment import load_alignment
+from modules.function_modules.Pi.Pi_engine import locus_pi
+
+
+class PiCalculationThread(QThread):
+    progress = pyqtSignal(int)
+    log = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+    def __init__(self, input_dir, reference_file, output_file, jobs, use_cache=True, compare_files=()):
+        super().__init__()
+        self.input_dir = input_dir
+        self.reference_file = reference_file
+        self.output_file = output_file
+        self.jobs = jobs
+        self.use_cache = use_cache
+        self.compare_files = list(compare_files)
+        self.missing_results = []
+        self.missing_reference = []
+
+    def run(self):
+        try:
+            pi_results_path = calculate_Pi_values(self.input_dir, self.jobs, self.report_progress, self.use_cache)
+            self.missing_results, self.missing_reference = sort_as_cp_order([pi_results_path] + self.compare_files,
+                                                                            self.reference_file, self.output_file)
+        except Exception as e:
+            self.error.emit(str(e))
+
+    def report_progress(self, done, total, result_line):
+        self.log.emit(result_line)
+        self.progress.emit(int(done / total * 100))
 
 
 class PiCalculateApp_V2(QWidget):
@@ -39,14 +70,35 @@ class PiCalculateApp_V2(QWidget):
         self.reference_button = QPushButton('Browse...')
         self.reference_button.clicked.connect(self.browse_reference)
 
+        # Pi results of other runs, e.g. other species, written as extra columns of the sorted table
+        self.compare_label = QLabel('Compare With:')
+        self.compare_edit = QLineEdit()
+        self.compare_edit.setReadOnly(True)
+        self.compare_edit.setPlaceholderText('Optional Pi_results.txt files of other runs')
+        self.compare_button = QPushButton('Browse...')
+        self.compare_button.clicked.connect(self.browse_compare)
+        self.compare_files = []
+
         self.mode_label = QLabel('Mode:')
         self.mode_combobox = QComboBox()
         self.mode_combobox.addItem('gene')
         self.mode_combobox.addItem('IGS')
 
+        self.jobs_label = QLabel('Processes:')
+        self.jobs_spinbox = QSpinBox()
+        self.jobs_spinbox.setMinimum(1)
+        self.jobs_spinbox.setMaximum(os.cpu_count() or 1)
+        self.jobs_spinbox.setValue(os.cpu_count() or 1)
+        self.cache_checkbox = QCheckBox('Cache parsed alignments')
+        self.cache_checkbox.setChecked(True)
+
         self.run_button = QPushButton('Run')
         self.run_button.clicked.connect(self.run_analysis)
 
+        self.progress_bar = QProgressBar()
+        self.status_label = QLabel()
+        self.status_label.setWordWrap(True)
+
         vbox = QVBoxLayout()
         # Title label
         label_title = QLabel('Calculate Pi by IGS/Gene')
@@ -71,12 +123,23 @@ class PiCalculateApp_V2(QWidget):
         hbox_ref.addWidget(self.reference_button)
         vbox.addLayout(hbox_ref)
 
+        hbox_compare = QHBoxLayout()
+        hbox_compare.addWidget(self.compare_label)
+        hbox_compare.addWidget(self.compare_edit)
+        hbox_compare.addWidget(self.compare_button)
+        vbox.addLayout(hbox_compare)
+
         hbox_mode = QHBoxLayout()
         hbox_mode.addWidget(self.mode_label)
         hbox_mode.addWidget(self.mode_combobox)
+        hbox_mode.addWidget(self.jobs_label)
+        hbox_mode.addWidget(self.jobs_spinbox)
+        hbox_mode.addWidget(self.cache_checkbox)
         vbox.addLayout(hbox_mode)
 
         vbox.addWidget(self.run_button)
+        vbox.addWidget(self.progress_bar)
+        vbox.addWidget(self.status_label)
         self.setLayout(vbox)
 
     def browse_input(self):
@@ -94,6 +157,11 @@ class PiCalculateApp_V2(QWidget):
         if file_path:
             self.reference_edit.setText(file_path)
 
+    def browse_compare(self):
+        file_paths, _ = QFileDialog.getOpenFileNames(self, 'Select Pi Results Files', '', 'Text Files (*.txt);;All Files (*)')
+        self.compare_files = file_paths
+        self.compare_edit.setText('; '.join(file_paths))
+
     def run_analysis(self):
         input_dir = self.input_edit.text().strip()
         output_dir = self.output_edit.text().strip()
@@ -112,84 +180,130 @@ class PiCalculateApp_V2(QWidget):
             QMessageBox.critical(self, 'Error', f"The specified reference file '{reference_file}' does not exist.")
             return
 
-        pi_results_path = calculate_Pi_values(input_dir)
-        output_file = os.path.join(output_dir, f"{mode}_sort_as_cp_order.txt")
-        sort_as_cp_order(pi_results_path, reference_file, output_file)
-
-        QMessageBox.information(self, 'Process Complete',
-                                f"The sorted results have been written into:\n{os.path.abspath(output_file)}")
-
-
-def calculate_Pi_values(work_dir):
+        self.output_file = os.path.join(output_dir, f"{mode}_sort_as_cp_order.txt")
+        self.run_button.setEnabled(False)
+        self.progress_bar.setValue(0)
+        self.failed = False
+
+        self.thread = PiCalculationThread(input_dir, reference_file, self.output_file, self.jobs_spinbox.value(),
+                                          self.cache_checkbox.isChecked(), self.compare_files)
+        self.thread.progress.connect(self.progress_bar.setValue)
+        self.thread.log.connect(self.status_label.setText)
+        self.thread.error.connect(self.calculation_failed)
+        self.thread.finished.connect(self.calculation_finished)
+        self.thread.start()
+
+    def calculation_failed(self, message):
+        self.failed = True
+        QMessageBox.critical(self, 'Error', f"Error calculating Pi values: {message}")
+
+    def calculation_finished(self):
+        self.run_button.setEnabled(True)
+        if not self.failed:
+            notes = []
+            if self.thread.missing_results:
+                notes.append(f"{len(self.thread.missing_results)} reference loci have no Pi value: "
+                             f"{', '.join(self.thread.missing_results)}")
+            if self.thread.missing_reference:
+                notes.append(f"{len(self.thread.missing_reference)} loci are not in the reference file: "
+                             f"{', '.join(self.thread.missing_reference)}")
+            self.status_label.setText('\n'.join(notes))
+            QMessageBox.information(self, 'Process Complete',
+                                    f"The sorted results have been written into:\n{os.path.abspath(self.output_file)}"
+                                    + ''.join(f"\n\n{note}" for note in notes))
+
+
+def calculate_Pi_values(work_dir, jobs=None, progress_callback=None, use_cache=True):
+    """Compute Pi for every aligned locus in work_dir and write Pi_results.txt.
+
+    Loci are farmed out to a process pool of `jobs` workers (all cores when None)
+    and reported through progress_callback(done, total, result_line) as they
+    finish. The results file is always written in file name order. With
+    use_cache=False the alignment cache is neither read nor written.
+    """
     if not work_dir.endswith('/'):
         work_dir += '/'
-    all_pi_results = []
-    for align_fasta in os.listdir(work_dir):
-        if align_fasta.endswith('.fasta'):
-            pi = calculate_pi_for_file(os.path.join(work_dir, align_fasta))
-            all_pi_results.append(f"{align_fasta[:-6]}\t{pi}")
-            print(f"{align_fasta[:-6]}\t{pi}")
+    align_fastas = sorted(align_fasta for align_fasta in os.listdir(work_dir) if align_fasta.endswith('.fasta'))
+    all_pi = {}
+
+    def collect(done, align_fasta, pi):
+        all_pi[align_fasta] = pi
+        if progress_callback is not None:
+            progress_callback(done, len(align_fastas), f"{align_fasta[:-6]}\t{pi}")
+
+    if jobs == 1:
+        for done, align_fasta in enumerate(align_fastas, start=1):
+            collect(done, align_fasta, calculate_pi_for_file(os.path.join(work_dir, align_fasta), use_cache))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(calculate_pi_for_file, os.path.join(work_dir, align_fasta), use_cache): align_fasta
+                       for align_fasta in align_fastas}
+            for done, future in enumerate(as_completed(futures), start=1):
+                collect(done, futures[future], future.result())
 
     pi_results_file = os.path.join(work_dir, 'Pi_results.txt')
     with open(pi_results_file, 'w') as ff:
-        for each_pi in all_pi_results:
-            ff.write(f"{each_pi}\n")
+        for align_fasta in align_fastas:
+            ff.write(f"{align_fasta[:-6]}\t{all_pi[align_fasta]}\n")
 
     return pi_results_file
 
 
-def calculate_pi_for_file(fasta_file):
-    sequences = []
-    gaps_positions = set()
-
-    for rec in SeqIO.parse(fasta_file, format='fasta'):
-        sequences.append(rec)
-        gaps_positions.update(i for i, base in enumerate(rec.seq) if base == '-')
-
-    all_number = len(sequences) * (len(sequences) - 1) / 2
-    filtered_sequences = filter_out_gaps(sequences, gaps_positions)
-    
-    if not filtered_sequences:
-        return format(0.0, '.5f')
-
-    pi_value = calculate_pi(filtered_sequences, all_number)
-
-    return format(pi_value, '.5f')
-
-
-def filter_out_gaps(sequences, gaps_positions):
-    filtered_sequences = []
-    for seq in sequences:
-        filtered_seq = ''.join(base for i, base in enumerate(seq.seq) if i not in gaps_positions)
-        filtered_sequences.append(filtered_seq)
-    return filtered_sequences
-
-
-def calculate_pi(sequences, all_number):
-    pi = 0
-    num_sequences = len(sequences)
-    
-    if not sequences or not sequences[0]:
-        return 0.0
-
-    for i in range(len(sequences[0])):
-        column = [seq[i] for seq in sequences]
-        diff = sum(1 for j in range(num_sequences) for k in range(j + 1, num_sequences) if column[j] != column[k])
-        pi += diff / all_number
-    return pi / len(sequences[0])
-
-
-def sort_as_cp_order(input_file1, input_file2, output_file):
-    with open(input_file1, 'r') as pi_results, open(input_file2, 'r') as cp_order_results, open(output_file, 'w') as results_file:
-        file1_line_list = pi_results.readlines()
-        file2_line_list = cp_order_results.readlines()
-
-        for cp_order_line in file2_line_list:
-            cp_order_name = cp_order_line.strip()
-            for pi_line in file1_line_list:
-                if pi_line.split('\t')[0] == cp_order_name:
-                    print(pi_line, end='', file=results_file)
-                    break
+def calculate_pi_for_file(fasta_file, use_cache=True):
+    alignment = load_alignment(fasta_file, normalize=False, use_cache=use_cache)
+    return format(locus_pi(alignment.matrix, alignment.gaps), '.5f')
+
+
+def index_pi_results(pi_results_file):
+    """Map every locus of a Pi results file to the rest of its first line."""
+    index = {}
+    with open(pi_results_file, 'r') as pi_results:
+        for pi_line in pi_results:
+            name, _, values = pi_line.rstrip('\n').partition('\t')
+            index.setdefault(name, values)
+    return index
+
+
+def results_labels(input_files):
+    """Name results files by their paths relative to the directory holding all of them."""
+    paths = [os.path.abspath(input_file) for input_file in input_files]
+    try:
+        common_dir = os.path.commonpath([os.path.dirname(path) for path in paths])
+    except ValueError:
+        return paths  # Files on different drives
+    return [os.path.relpath(path, common_dir) for path in paths]
+
+
+def sort_as_cp_order(input_files, reference_file, output_file):
+    """Write Pi results in the locus order of reference_file.
+
+    input_files is one results file or a list of them; with several files each
+    output line holds one value per file, in the order given, and NA where a
+    file lacks the locus, under a header row naming the files. Returns the
+    reference loci found in no results file and the result loci absent from
+    the reference.
+    """
+    if isinstance(input_files, str):
+        input_files = [input_files]
+    indexes = [index_pi_results(input_file) for input_file in input_files]
+    with open(reference_file, 'r') as cp_order_results:
+        cp_order = [cp_order_line.strip() for cp_order_line in cp_order_results if cp_order_line.strip()]
+
+    missing_results = []
+    with open(output_file, 'w') as results_file:
+        if len(input_files) > 1:
+            print('Locus', *results_labels(input_files), sep='\t', file=results_file)
+        for cp_order_name in cp_order:
+            values = [index.get(cp_order_name) for index in indexes]
+            if all(value is None for value in values):
+                missing_results.append(cp_order_name)
+                continue
+            print(cp_order_name, *(value if value is not None else 'NA' for value in values), sep='\t', file=results_file)
+
+    cp_order_names = set(cp_order)
+    missing_reference = [name for name in dict.fromkeys(name for index in indexes for name in index)
+                         if name not in cp_order_names]
+    return missing_results, missing_reference
 
 
 if __name__ == '__main__':
@@ -0,0 +1,91 @@
+'''
+Copyright 2024 JunqiaoZhu Zhejiang Sci-Tech University
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import numpy as np
+
+# Symbols allowed in an alignment once N has been read as a gap
+_VALID_SITES = np.zeros(256, dtype=bool)
+_VALID_SITES[list(b'ATGC-')] = True
+# Number of offending positions quoted when an alignment holds invalid characters
+_MAX_REPORTED_SITES = 10
+
+
+def gapped_columns(aln):
+    """Return a boolean mask of the columns holding at least one gap."""
+    return (aln == ord('-')).any(axis=0)
+
+
+def check_sites(aln, block_columns=16384):
+    """Raise ValueError quoting the first sites of an encoded alignment that are not ATGC or a gap.
+
+    The matrix is scanned in blocks of columns so no full-size temporary is made.
+    """
+    rows, cols = [], []
+    for start in range(0, aln.shape[1], block_columns):
+        block_rows, block_cols = np.nonzero(~_VALID_SITES[aln[:, start:start + block_columns]])
+        rows.append(block_rows)
+        cols.append(block_cols + start)
+    if not rows or not sum(len(r) for r in rows):
+        return
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    order = np.lexsort((cols, rows))[:_MAX_REPORTED_SITES]
+    sites = ', '.join(f"{chr(aln[r, c])!r} (sequence {r + 1}, column {c + 1})"
+                      for r, c in zip(rows[order].tolist(), cols[order].tolist()))
+    more = f" and {len(rows) - _MAX_REPORTED_SITES} more" if len(rows) > _MAX_REPORTED_SITES else ""
+    raise ValueError(f"Some site is not ATGC in conserved site: {sites}{more}")
+
+
+def column_diffs(aln):
+    """Count the differing sequence pairs of every column from its symbol counts.
+
+    A column holding c copies of each symbol among n sequences has
+    sum(c * (n - c)) / 2 differing pairs, so no pairwise comparison is needed.
+    """
+    sample_nu = aln.shape[0]
+    diffs = np.zeros(aln.shape[1], dtype=np.int64)
+    for symbol in np.flatnonzero(np.bincount(aln.ravel(), minlength=256)):
+        counts = np.count_nonzero(aln == symbol, axis=0)
+        diffs += counts * (sample_nu - counts)
+    return diffs // 2
+
+
+def cumulative_sites(diffs):
+    """Return prefix sums of pairwise differences and of segregating sites."""
+    cum_diffs = np.zeros(len(diffs) + 1, dtype=np.int64)
+    np.cumsum(diffs, out=cum_diffs[1:])
+    cum_segregating = np.zeros(len(diffs) + 1, dtype=np.int64)
+    np.cumsum(diffs > 0, out=cum_segregating[1:])
+    return cum_diffs, cum_segregating
+
+
+def window_sums(cum_diffs, cum_segregating, window, step):
+    """Return 0-based window starts with the summed differences and segregating sites per window."""
+    loop = int((len(cum_diffs) - 1 - window) / step)
+    starts = np.arange(loop + 1, dtype=np.int64) * step
+    ends = starts + window
+    return starts, cum_diffs[ends] - cum_diffs[starts], cum_segregating[ends] - cum_segregating[starts]
+
+
+def locus_pi(aln, gaps=None):
+    """Return Pi of a whole locus over its ungapped columns."""
+    if gaps is None:
+        gaps = gapped_columns(aln)
+    kept = aln[:, ~gaps]
+    sample_nu, len_seq = kept.shape
+    if sample_nu < 2 or len_seq == 0:
+        return 0.0
+    all_number = sample_nu * (sample_nu - 1) / 2
+    return int(column_diffs(kept).sum()) / all_number / len_seq
@@ -0,0 +1,253 @@
+'''
+Copyright 2024 JunqiaoZhu Zhejiang Sci-Tech University
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import numpy as np
+
+# Every site is stored as a 4-bit IUPAC mask (A=1, C=2, G=4, T=8), so a gap is 0,
+# N is 15 and the ambiguity codes are the unions of their bases
+CODE_SYMBOLS = b'-ACMGRSVTWYHKDBN'
+_ENCODE = np.full(256, 15, dtype=np.uint8)
+for _code, _symbol in enumerate(CODE_SYMBOLS):
+    _ENCODE[_symbol] = _ENCODE[_symbol + 32 if _symbol >= ord('A') else _symbol] = _code
+_ENCODE[ord('U')] = _ENCODE[ord('u')] = 8
+# The Pi window calculator reads N as a gap (see Pi_alignment), so it packs with this table
+_ENCODE_N_AS_GAP = _ENCODE.copy()
+_ENCODE_N_AS_GAP[ord('N')] = _ENCODE_N_AS_GAP[ord('n')] = 0
+
+# Masks of the popcount over 64-bit words of packed sites: the lowest bit of
+# every nibble, the two lowest bits of every byte and the lowest bit of every byte
+_NIBBLE_LOW_BITS = np.uint64(0x1111111111111111)
+_BYTE_LOW_PAIRS = np.uint64(0x0303030303030303)
+_BYTE_LOW_BITS = np.uint64(0x0101010101010101)
+
+# Columns handled at a time, bounding the temporaries of 1,000-taxon alignments
+BLOCK_COLUMNS = 16384
+# Upper bound on the XOR-ed words held at once by hamming_matrix
+HAMMING_BLOCK_WORDS = 1 << 17
+
+
+def _as_words(packed):
+    """Copy packed rows into uint64 words, padding every row with gap bytes to a multiple of 8."""
+    padded = np.zeros((packed.shape[0], -(-packed.shape[1] // 8) * 8), dtype=np.uint8)
+    padded[:, :packed.shape[1]] = packed
+    return padded.view(np.uint64)
+
+
+def _nibble_popcount(words):
+    """Count the non-zero nibbles of every uint64 word, i.e. the differing sites of XOR-ed rows.
+
+    words is overwritten with the counts.
+    """
+    # Fold each nibble onto its lowest bit, add the two bits of every byte, then
+    # sum the bytes into the top one
+    words |= words >> np.uint64(2)
+    words |= words >> np.uint64(1)
+    words &= _NIBBLE_LOW_BITS
+    words += words >> np.uint64(4)
+    words &= _BYTE_LOW_PAIRS
+    words *= _BYTE_LOW_BITS
+    words >>= np.uint64(56)
+    return words
+
+
+class PackedAlignment:
+    """An alignment stored at two sites per byte.
+
+    Row i of data holds sequence i, with column 2k in the high nibble and
+    column 2k + 1 in the low nibble of byte k. An odd trailing nibble is left
+    as a gap.
+    """
+
+    def __init__(self, data, n_columns):
+        self.data = data
+        self.n_columns = n_columns
+
+    @classmethod
+    def from_matrix(cls, aln, n_as_gap=False):
+        """Pack a (sequences x columns) ASCII matrix; unknown symbols are read as N.
+
+        N is an allele of its own (code 15) unless n_as_gap is set, in which
+        case it is packed as a gap, matching the alignments parsed for the Pi
+        window calculator.
+        """
+        table = _ENCODE_N_AS_GAP if n_as_gap else _ENCODE
+        sample_nu, n_columns = aln.shape
+        data = np.zeros((sample_nu, (n_columns + 1) // 2), dtype=np.uint8)
+        for start in range(0, n_columns, BLOCK_COLUMNS):
+            codes = table[aln[:, start:start + BLOCK_COLUMNS]]
+            block = data[:, start // 2:start // 2 + (codes.shape[1] + 1) // 2]
+            block[:] = codes[:, 0::2] << 4
+            block[:, :codes.shape[1] // 2] |= codes[:, 1::2]
+        return cls(data, n_columns)
+
+    @property
+    def shape(self):
+        return self.data.shape[0], self.n_columns
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def unpack(self, start=0, stop=None):
+        """Return the 4-bit codes of columns start:stop as a uint8 matrix."""
+        stop = self.n_columns if stop is None else min(stop, self.n_columns)
+        first, last = start // 2, (stop + 1) // 2
+        packed = self.data[:, first:last]
+        codes = np.empty((packed.shape[0], packed.shape[1] * 2), dtype=np.uint8)
+        codes[:, 0::2] = packed >> 4
+        codes[:, 1::2] = packed & 15
+        return codes[:, start - first * 2:stop - first * 2]
+
+    def columns(self, key):
+        """Return the columns selected by a slice, an index array or a boolean mask as a new PackedAlignment."""
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.n_columns)
+            if step == 1 and start % 2 == 0:
+                # Byte-aligned ranges are cut straight out of the packed rows
+                n_columns = max(stop - start, 0)
+                data = self.data[:, start // 2:start // 2 + (n_columns + 1) // 2].copy()
+                if n_columns % 2:
+                    data[:, -1] &= 0xF0
+                return PackedAlignment(data, n_columns)
+            key = np.arange(start, stop, step)
+        key = np.asarray(key)
+        if key.dtype == bool:
+            key = np.flatnonzero(key)
+        data = np.zeros((self.data.shape[0], (len(key) + 1) // 2), dtype=np.uint8)
+        for start in range(0, len(key), BLOCK_COLUMNS):
+            cols = key[start:start + BLOCK_COLUMNS]
+            codes = (self.data[:, cols // 2] >> ((1 - cols % 2) * 4).astype(np.uint8)) & 15
+            block = data[:, start // 2:start // 2 + (len(cols) + 1) // 2]
+            block[:] = codes[:, 0::2] << 4
+            block[:, :len(cols) // 2] |= codes[:, 1::2]
+        return PackedAlignment(data, len(key))
+
+    def allele_counts(self):
+        """Return a (16 x columns) matrix counting every 4-bit code in every column.
+
+        Each packed byte column is histogrammed in a single bincount over its
+        256 byte values, and the high and low nibble counts are read off the
+        histogram, so the codes are never unpacked.
+        """
+        sample_nu, n_bytes = self.data.shape
+        counts = np.zeros((16, n_bytes * 2), dtype=np.int64)
+        block_bytes = BLOCK_COLUMNS // 2
+        for start in range(0, n_bytes, block_bytes):
+            block = self.data[:, start:start + block_bytes]
+            width = block.shape[1]
+            bins = block.astype(np.int32)
+            bins += np.arange(width, dtype=np.int32) * 256
+            histogram = np.bincount(bins.ravel(), minlength=width * 256).reshape(width, 16, 16)
+            counts[:, 2 * start:2 * (start + width):2] = histogram.sum(axis=2).T
+            counts[:, 2 * start + 1:2 * (start + width):2] = histogram.sum(axis=1).T
+        return counts[:, :self.n_columns]
+
+    def gapped_columns(self):
+        """Return a boolean mask of the columns holding at least one gap."""
+        return self.allele_counts()[0] > 0
+
+    def column_diffs(self):
+        """Count the differing sequence pairs of every column, as Pi_engine.column_diffs does."""
+        counts = self.allele_counts()
+        return (counts * (self.data.shape[0] - counts)).sum(axis=0) // 2
+
+    def hamming(self, i, j):
+        """Return the number of columns at which the 4-bit codes of sequences i and j differ.
+
+        The packed rows are XOR-ed 16 sites per 64-bit word and the non-zero
+        nibbles counted with a popcount, so a gap or N against a base counts
+        as a difference.
+        """
+        words = _as_words(self.data[[i, j]])
+        return int(_nibble_popcount(words[0] ^ words[1]).sum(dtype=np.int64))
+
+    def hamming_matrix(self):
+        """Return the symmetric (sequences x sequences) matrix of pairwise Hamming distances.
+
+        Columns where every sequence agrees add nothing, so only the
+        polymorphic columns are compared. Each row block is XOR-ed against
+        all later rows at once, keeping the temporaries under
+        HAMMING_BLOCK_WORDS words.
+        """
+        sample_nu = self.data.shape[0]
+        distances = np.zeros((sample_nu, sample_nu), dtype=np.int64)
+        polymorphic = self.columns(self.column_diffs() > 0)
+        for start in range(0, polymorphic.data.shape[1], BLOCK_COLUMNS // 2):
+            words = _as_words(polymorphic.data[:, start:start + BLOCK_COLUMNS // 2])
+            first = 0
+            while first < sample_nu - 1:
+                rows = max(1, HAMMING_BLOCK_WORDS // ((sample_nu - first) * words.shape[1]))
+                block = words[first:first + rows]
+                xored = block[:, None, :] ^ words[None, first:, :]
+                distances[first:first + rows, first:] += _nibble_popcount(xored).sum(axis=2, dtype=np.int64)
+                first += rows
+        # Row blocks also filled part of the lower triangle; keep the upper one and mirror it
+        distances = np.triu(distances, 1)
+        return distances + distances.T
+
+
+def benchmark(sample_nu=1000, n_columns=160000, mutation_rate=0.01, hamming_sample=200, seed=0):
+    """Compare the byte-matrix Pi kernels with their PackedAlignment counterparts.
+
+    A random alignment of sample_nu sequences is built with about
+    mutation_rate of its sites changed to another base or a gap. Prints the
+    memory taken by both forms, and the time of Pi_engine.column_diffs against
+    PackedAlignment.column_diffs and of a row-by-row byte comparison against
+    hamming_matrix over the first hamming_sample sequences, checking that
+    every pair of results agrees.
+    """
+    import time
+    from modules.function_modules.Pi.Pi_engine import column_diffs
+
+    rng = np.random.default_rng(seed)
+    aln = np.repeat(rng.choice(np.frombuffer(b'ACGT', dtype=np.uint8), n_columns)[None], sample_nu, axis=0)
+    mutated = rng.random(aln.shape) < mutation_rate
+    aln[mutated] = rng.choice(np.frombuffer(b'ACGT-', dtype=np.uint8), int(mutated.sum()))
+    packed = PackedAlignment.from_matrix(aln)
+    if not np.array_equal(packed.unpack(), _ENCODE[aln]):
+        raise AssertionError("packed sites differ from the byte matrix")
+
+    start_time = time.time()
+    byte_diffs = column_diffs(aln)
+    byte_time = time.time() - start_time
+    start_time = time.time()
+    packed_diffs = packed.column_diffs()
+    packed_time = time.time() - start_time
+    if not np.array_equal(byte_diffs, packed_diffs):
+        raise AssertionError("packed column differences differ from Pi_engine.column_diffs")
+
+    sample = aln[:hamming_sample]
+    start_time = time.time()
+    byte_distances = np.zeros((len(sample), len(sample)), dtype=np.int64)
+    for i in range(len(sample) - 1):
+        byte_distances[i, i + 1:] = np.count_nonzero(sample[i + 1:] != sample[i], axis=1)
+    byte_distances += byte_distances.T
+    byte_hamming_time = time.time() - start_time
+    start_time = time.time()
+    packed_distances = PackedAlignment(packed.data[:hamming_sample], n_columns).hamming_matrix()
+    packed_hamming_time = time.time() - start_time
+    if not np.array_equal(byte_distances, packed_distances):
+        raise AssertionError("packed Hamming distances differ from the byte comparison")
+
+    print(f"{sample_nu} sequences x {n_columns} columns, Hamming distances over {len(sample)} sequences")
+    print(f"byte matrix:   {aln.nbytes / 2 ** 20:8.1f} MiB  column_diffs {byte_time:.2f}s  "
+          f"hamming {byte_hamming_time:.2f}s")
+    print(f"packed matrix: {packed.nbytes / 2 ** 20:8.1f} MiB  column_diffs {packed_time:.2f}s  "
+          f"hamming {packed_hamming_time:.2f}s")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -202,6 +202,21 @@ class PiplotApp(QMainWindow):
         if fileName:
             self.data_file = fileName
             self.file_path_edit.setText(f'File: {fileName}')
+            self.updateYAxisColumns()
+
+    def updateYAxisColumns(self):
+        # Any window table in the Start/End/Midpoint layout can be plotted, e.g. the SSR density track
+        try:
+            with open(self.data_file) as f:
+                columns = f.readline().split()
+        except OSError:
+            return
+        if 'Midpoint' not in columns:
+            return
+        y_columns = columns[columns.index('Midpoint') + 1:]
+        if y_columns:
+            self.yaxis_data_combo.clear()
+            self.yaxis_data_combo.addItems(y_columns)
 
     def selectOutputDir(self):
         options = QFileDialog.Options()
@@ -249,7 +264,7 @@ class PiplotApp(QMainWindow):
         try:
             data = np.genfromtxt(self.data_file, delimiter='\t', dtype=None, names=True)
             midpoints = data['Midpoint']
-            y_data = data['Pi'] if self.yaxis_data_combo.currentText() == 'Pi' else data['S']
+            y_data = data[self.yaxis_data_combo.currentText()]
 
             fig_width = self.fig_width_spinbox.value()
             fig_height = self.fig_height_spinbox.value()
@@ -292,7 +307,8 @@ class PiplotApp(QMainWindow):
                           fontstyle='italic' if font.italic() else 'normal')
 
             # Set y-axis label
-            y_label = 'Pi Values' if self.yaxis_data_combo.currentText() == 'Pi' else 'S Values'
+            y_column = self.yaxis_data_combo.currentText()
+            y_label = {'Pi': 'Pi Values', 'S': 'S Values'}.get(y_column, y_column)
             ax.set_ylabel(y_label, fontsize=font.pointSize(), fontname=font.family(),
                           fontweight='bold' if font.bold() else 'normal',
                           fontstyle='italic' if font.italic() else 'normal')
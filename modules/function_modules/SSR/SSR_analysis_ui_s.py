@@ -9,18 +9,58 @@ site:   https://github.com/Xwb7533/CPStools
 
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QListWidget, QPushButton,
-    QHBoxLayout, QLineEdit, QFileDialog, QMessageBox
+    QHBoxLayout, QLineEdit, QFileDialog, QMessageBox, QProgressBar, QSpinBox, QTextEdit, QCheckBox
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QFont
-from Bio import SeqIO
 import os
-import re
+from modules.function_modules.SSR.SSR_engine import DEFAULT_TYPE_LENGTHS, run_SSR_batch
+from modules.function_modules.SSR.SSR_stats import species_name, write_statistics
+
+class SSRFinderThread(QThread):
+    progress = pyqtSignal(int)
+    log = pyqtSignal(str)
+
+    def __init__(self, input_files, output_directory, type_lengths, jobs, max_interruption=None, density=None):
+        super().__init__()
+        self.input_files = input_files
+        self.output_directory = output_directory
+        self.type_lengths = type_lengths
+        self.jobs = jobs
+        self.max_interruption = max_interruption
+        self.density = density
+        self.errors = []
+        self.statistics_files = []
+
+    def run(self):
+        try:
+            results, self.errors = run_SSR_batch(self.input_files, self.output_directory, self.type_lengths, self.jobs,
+                                                 self.report_progress, self.isInterruptionRequested, self.max_interruption,
+                                                 self.density)
+            if self.isInterruptionRequested():
+                self.log.emit(f"Cancelled after {len(results) + len(self.errors)} of {len(self.input_files)} files; "
+                              f"no statistics tables were written.")
+                return
+            # Statistics come from the counts returned by every genome, not from re-reading the .anno files
+            all_counts = {species_name(name): counts for name, SSR_number, counts in results.values()}
+            if all_counts:
+                self.statistics_files = write_statistics(all_counts, self.output_directory)
+                self.log.emit("Statistics tables written:\n" + '\n'.join(self.statistics_files))
+        except Exception as e:
+            self.errors.append(('', str(e)))
+            self.log.emit(f"Error running SSR Finder: {e}")
+
+    def report_progress(self, done, total, input_file, error):
+        if error is None:
+            self.log.emit(f"[{done}/{total}] {os.path.basename(input_file)}")
+        else:
+            self.log.emit(f"[{done}/{total}] {os.path.basename(input_file)} failed: {error}")
+        self.progress.emit(int(done / total * 100))
 
 class SSRFindApp(QWidget):
     def __init__(self):
         super().__init__()
-        self.type_lengths = [10, 5, 4, 3, 3, 3]  # Default SSR lengths
+        self.type_lengths = list(DEFAULT_TYPE_LENGTHS)  # Default SSR lengths
         self.initUI()
         self.input_files = []
     def initUI(self):
@@ -87,11 +127,57 @@ class SSRFindApp(QWidget):
 
         layout.addLayout(frame_length)
 
+        # Compound SSRs: SSRs separated by at most the given number of bases are merged
+        frame_compound = QHBoxLayout()
+        self.check_compound = QCheckBox("Merge compound SSRs")
+        frame_compound.addWidget(self.check_compound)
+        frame_compound.addWidget(QLabel("Max interruption (bp):"))
+        self.spin_interruption = QSpinBox()
+        self.spin_interruption.setRange(0, 1000)
+        self.spin_interruption.setValue(100)
+        self.spin_interruption.setEnabled(False)
+        self.check_compound.toggled.connect(self.spin_interruption.setEnabled)
+        frame_compound.addWidget(self.spin_interruption)
+        frame_compound.addStretch()
+        layout.addLayout(frame_compound)
+
+        # SSR density along the genome, in the same window layout as the Pi tables
+        frame_density = QHBoxLayout()
+        self.check_density = QCheckBox("Write SSR density")
+        frame_density.addWidget(self.check_density)
+        frame_density.addWidget(QLabel("Window length:"))
+        self.spin_density_window = QSpinBox()
+        self.spin_density_window.setRange(1, 1000000)
+        self.spin_density_window.setValue(1000)
+        frame_density.addWidget(self.spin_density_window)
+        frame_density.addWidget(QLabel("Step size:"))
+        self.spin_density_step = QSpinBox()
+        self.spin_density_step.setRange(1, 1000000)
+        self.spin_density_step.setValue(500)
+        frame_density.addWidget(self.spin_density_step)
+        for spin in (self.spin_density_window, self.spin_density_step):
+            spin.setEnabled(False)
+            self.check_density.toggled.connect(spin.setEnabled)
+        frame_density.addStretch()
+        layout.addLayout(frame_density)
+
         # Buttons
         frame_buttons = QHBoxLayout()
-        button_run = QPushButton("Run SSR Finder")
-        button_run.clicked.connect(self.run_ssr_finder)
-        frame_buttons.addWidget(button_run)
+        frame_buttons.addWidget(QLabel("Processes:"))
+        self.spin_jobs = QSpinBox()
+        self.spin_jobs.setMinimum(1)
+        self.spin_jobs.setMaximum(os.cpu_count() or 1)
+        self.spin_jobs.setValue(os.cpu_count() or 1)
+        frame_buttons.addWidget(self.spin_jobs)
+
+        self.button_run = QPushButton("Run SSR Finder")
+        self.button_run.clicked.connect(self.run_ssr_finder)
+        frame_buttons.addWidget(self.button_run)
+
+        self.button_cancel = QPushButton("Cancel")
+        self.button_cancel.setEnabled(False)
+        self.button_cancel.clicked.connect(self.cancel_ssr_finder)
+        frame_buttons.addWidget(self.button_cancel)
         
         button_quit = QPushButton("Quit")
         button_quit.clicked.connect(self.close)
@@ -99,6 +185,12 @@ class SSRFindApp(QWidget):
 
         layout.addLayout(frame_buttons)
 
+        self.progress_bar = QProgressBar()
+        layout.addWidget(self.progress_bar)
+        self.text_log = QTextEdit()
+        self.text_log.setReadOnly(True)
+        layout.addWidget(self.text_log)
+
         self.setLayout(layout)
 
     def add_files(self):
@@ -132,199 +224,47 @@ class SSRFindApp(QWidget):
             QMessageBox.critical(self, "Error", "Please select input files.")
             return
 
+        if not os.path.isdir(output_directory):
+            QMessageBox.critical(self, "Error", "Please select an existing output directory.")
+            return
+
         try:
             # Retrieve SSR lengths from input fields
             self.type_lengths = [int(entry.text()) for entry in self.entry_lengths]
-
-            for input_file in self.input_files:
-                file_path = os.path.abspath(input_file)
-                check_results = self.check_files(file_path)
-
-                if check_results:
-                    self.find_SSRs(file_path, *self.type_lengths)
-                    self.IGS_extract(file_path)
-
-            QMessageBox.information(self, "Success", "Batch SSRs extraction completed successfully!")
-        except Exception as e:
+        except ValueError as e:
             QMessageBox.critical(self, "Error", f"Error running SSR Finder: {str(e)}")
+            return
 
-    def check_files(self, input_file):
-        try:
-            if input_file.endswith('.fasta') or input_file.endswith('.fa'):
-                for rec in SeqIO.parse(input_file, 'fasta'):
-                    print("Please input Genbank format file")
-            if input_file.endswith('.gb') or input_file.endswith('.gbk'):
-                for rec in SeqIO.parse(input_file, 'genbank'):
-                    return str(rec.seq)
-            raise ValueError(f"Unsupported file format for '{input_file}'. "
-                             f"Please use FASTA (.fasta or .fa) or GenBank (.gb or .gbk) files.")
-        except Exception as e:
-            if isinstance(e, FileNotFoundError):
-                raise  # Reraise the FileNotFoundError
-            elif os.path.exists(input_file):
-                raise ValueError(f"Error processing file '{input_file}': {e}")
-            else:
-                raise FileNotFoundError(f"No such file: {input_file}")
-
-    def find_SSRs(self, input_file, *length):
-        type_length = []
-        if len(length) == 0:
-            type_length = [10, 5, 4, 3, 3, 3]
-        elif len(length) == 6:
-            type_length = length
+        self.button_run.setEnabled(False)
+        self.button_cancel.setEnabled(True)
+        self.progress_bar.setValue(0)
+        self.text_log.clear()
+
+        input_files = [os.path.abspath(input_file) for input_file in self.input_files]
+        max_interruption = self.spin_interruption.value() if self.check_compound.isChecked() else None
+        density = (self.spin_density_window.value(), self.spin_density_step.value()) \
+            if self.check_density.isChecked() else None
+        self.worker = SSRFinderThread(input_files, output_directory, self.type_lengths, self.spin_jobs.value(),
+                                      max_interruption, density)
+        self.worker.progress.connect(self.progress_bar.setValue)
+        self.worker.log.connect(self.text_log.append)
+        self.worker.finished.connect(self.ssr_finder_finished)
+        self.worker.start()
+
+    def cancel_ssr_finder(self):
+        self.button_cancel.setEnabled(False)
+        self.worker.requestInterruption()
+
+    def ssr_finder_finished(self):
+        self.button_run.setEnabled(True)
+        self.button_cancel.setEnabled(False)
+        if self.worker.isInterruptionRequested():
+            return
+        if self.worker.errors:
+            QMessageBox.warning(self, "Warning", f"{len(self.worker.errors)} of {len(self.worker.input_files)} files "
+                                                 f"failed, see the log for details.")
         else:
-            print("Please input type length equal 6 or 0")
-            return []
-        k1, k2, k3, k4, k5, k6 = type_length
-
-        print(f"The parameter is set as:\n"
-              f"Mononucleotide:{k1}\n"
-              f"Dinucleotide:{k2}\n"
-              f"Trinucleotide:{k3}\n"
-              f"Tetranucleotide:{k4}\n"
-              f"Pentanucleotide:{k5}\n"
-              f"Hexanucleotide:{k6}\n")
-        my_seq = self.check_files(input_file)
-        matches = {
-            'match1': re.finditer(r'([ATCG])\1{{{0},}}'.format(k1 - 1), my_seq),
-            'match2': re.finditer(r'(((?!AA|TT|CC|GG)[ATCG]){{2}})\1{{{0},}}'.format(k2 - 1), my_seq),
-            'match3': re.finditer(r'(((?!AAA|TTT|CCC|GGG)[ATCG]){{3}})\1{{{0},}}'.format(k3 - 1), my_seq),
-            'match4': re.finditer(r'(?!(\w)(\w)\1\2)(((?!AAAA|TTTT|CCCC|GGGG)[ATCG]){{4}})\3{{{0},}}'.format(k4 - 1),
-                                  my_seq),
-            'match5': re.finditer(r'(((?!AAAAA|TTTTT|CCCCC|GGGGG)[ATCG]){{5}})\1{{{0},}}'.format(k5 - 1), my_seq),
-            'match6': re.finditer(
-                r'(?!(\w)(\w)(\w)\1\2\3)(((?!AAAAAA|TTTTTT|CCCCCC|GGGGGG)[ATCG]){{6}})\4{{{0},}}'.format(k6 - 1), my_seq)
-        }
-        all_matches = []
-        for index_ in range(1, 7):
-            group_name = 'match' + str(index_)
-            for m in matches[group_name]:
-                start = m.start() + 1
-                if not any(start == int(match.split('\t')[2]) for match in all_matches):
-                    character = m.group()[:index_]
-                    length = len(m.group()) // index_
-                    end = m.end()
-                    output = f"{character}\t{length}\t{start}\t{end}"
-
-                    all_matches.append(output)
-
-        all_matches_sorted = sorted(all_matches, key=lambda x: int(x.split('\t')[2]))
-        file_name = os.path.basename(input_file).split('.')[0]
-        save_name = file_name + "."
-        output_directory = self.entry_output.text()       
-        file_save = os.path.join(output_directory, save_name)
-        with open(file_save, 'w') as ff:
-            ff.write("type\tlength\tstart\tend\n")
-            for SSRs_ in all_matches_sorted:
-                ff.write(f"{SSRs_}\n")
-        print(f"results:\ttotal {len(all_matches)} SSRs were detected!\n{'-' * 80}")
-
-    def IGS_extract(self, input_file):
-        for rec in SeqIO.parse(input_file, format='genbank'):
-            genome_length = [[int(part.end)] for part in rec.features[0].location.parts][0][0]
-            my_seq = rec.seq
-            all_feature = []
-            all_info = []
-            for feature in rec.features:
-                if feature.type == 'CDS' or feature.type == 'tRNA' or feature.type == 'rRNA':
-                    all_feature.append(feature)
-            for i in range(len(all_feature)):
-                gene_name = all_feature[i].qualifiers['gene'][0]
-                gene_location = all_feature[i].location.parts
-                gene1_exon_info = [[int(part.start), int(part.end), part.strand] for part in gene_location]
-                exon_number = len(gene_location)
-                if exon_number == 1:
-                    all_info.append(f"{gene_name}\t{gene1_exon_info[0][0]}\t{gene1_exon_info[0][1]}\t{gene1_exon_info[0][2]}")
-                    all_info.append(f"{gene_name}\t{gene1_exon_info[0][0]}\t{gene1_exon_info[0][1]}\t{gene1_exon_info[0][2]}")
-                if exon_number == 2:
-                    if gene1_exon_info[0][1] == genome_length:
-                        all_info.append(f"{gene_name}\t{gene1_exon_info[0][0]}\t{gene1_exon_info[0][1]}\t{gene1_exon_info[1][0]}\t{gene1_exon_info[1][1]}\t{gene1_exon_info[0][2]}")
-                    else:
-                        all_info.append(f"{gene_name}_1\t{gene1_exon_info[0][0]}\t{gene1_exon_info[0][1]}\t{gene1_exon_info[0][2]}")
-                        all_info.append(f"{gene_name}_2\t{gene1_exon_info[1][0]}\t{gene1_exon_info[1][1]}\t{gene1_exon_info[1][2]}")
-                if exon_number == 3:
-                    all_info.append(f"{gene_name}_1\t{gene1_exon_info[0][0]}\t{gene1_exon_info[0][1]}\t{gene1_exon_info[0][2]}")
-                    all_info.append(f"{gene_name}_2\t{gene1_exon_info[1][0]}\t{gene1_exon_info[1][1]}\t{gene1_exon_info[1][2]}")
-                    all_info.append(f"{gene_name}_3\t{gene1_exon_info[2][0]}\t{gene1_exon_info[2][1]}\t{gene1_exon_info[2][2]}")
-            all_info = list(set(all_info))
-            all_info.sort(key=lambda x: int(x.split('\t')[1]))
-            save_file = os.path.join(os.path.dirname(input_file), os.path.basename(input_file).split('.')[0] + '_SSRs.txt')
-            save_file_w = open(save_file, 'w')
-            for i in range(len(all_info)-1):
-                info_list = all_info[i].split('\t')
-                next_list = all_info[i+1].split('\t')
-                save_file_w.write(f"{info_list[0]}\t{info_list[1]}\t{info_list[2]}\tGene\n")
-                save_file_w.write(f"{info_list[0]}-{next_list[0]}\t{info_list[-2]}\t{next_list[1]}\tIGS\n")
-            save_file_w.write(f"{all_info[-1][:-1]}\tGene\n")
-            end_gene_info = all_info[-1].split('\t')
-            start_gene_info = all_info[0].split('\t')
-            if int(end_gene_info[-2]) < int(start_gene_info[1]):
-                save_file_w.write(f"{end_gene_info[0]}-{start_gene_info}[0]\t{end_gene_info[-2]}\t{start_gene_info[1]}"
-                                  f"\tGene\n")
-            else:
-                if int(end_gene_info[2]) < genome_length:
-                    save_file_w.write(f"{end_gene_info[0]}-{start_gene_info[0]}\t{end_gene_info[-2]}\t{genome_length}\t0\t\
-                    {start_gene_info[1]}\tIGS\n")
-                else:
-                    pass
-            save_file_w.close()
-
-            # change location type 
-            output_ = os.path.join(os.path.dirname(input_file), os.path.basename(input_file).split('.')[0] + '_SSRs2.txt')
-            change_file = open(save_file, 'r').readlines()
-            with open(output_, 'w') as gg:
-                for loc2 in change_file:
-                    loc_type = loc2.split('\t')[0]
-                    if "matK" in loc_type and "trnK-UUU" in loc_type:
-                        loc2_list = loc2.split('\t')
-                        loc2_list[-1] = "Intron"
-                        gg.write('\t'.join(loc_x for loc_x in loc2_list) + '\n')
-                    else:
-                        if len(loc_type.split('_')) == 3:
-                            N1, N3 = loc2.split('_')[0], loc2.split('_')[1]
-                            if N1 in N3:
-                                loc2_list = loc2.split('\t')
-                                loc2_list[-1] = "Intron"
-                                gg.write('\t'.join(loc_x for loc_x in loc2_list) + '\n')
-                            else:
-                                gg.write(loc2)
-                        else:
-                            gg.write(loc2)
-
-            # get location
-            file_name = os.path.basename(input_file).split('.')[0]
-            save_name = file_name + "."
-            file1 = os.path.join(os.path.dirname(input_file), save_name)
-            st_lines = open(output_, 'r').readlines()[1:]
-            output_directory = self.entry_output.text()
-            final_name = file_name + ".anno"
-            final_results = os.path.join(output_directory, final_name)
-            data = []
-            st_lines2 = open(file1, 'r').readlines()[1:]
-            for line in st_lines:
-                parts = line.strip().split('\t')
-                name, start, end, loc = parts[0], int(parts[1]), int(parts[2]), parts[-1]
-                data.append((name, start, end, loc))
-
-            printed_combinations = set()
-            # write output results
-            with open(final_results, 'w') as ff:
-                ff.write("type\tlength\tstart\tend\tloc\tloc_type\n")
-                for i in st_lines2:
-                    st_list = i.split('\t')
-                    st_join = '\t'.join(info.strip() for info in st_list)
-                    target_list = list(range(int(st_list[2]), int(st_list[3])))
-                    for num in target_list:
-                        for name, start, end, loc in data:
-                            if start <= num <= end:
-                                combination = (tuple(target_list), name)
-                                if combination not in printed_combinations:
-                                    ff.write(f"{st_join}\t{name}\t{loc}\n")
-                                    printed_combinations.add(combination)
-                                break
-        os.remove(output_)
-        os.remove(save_file)
-        print(f"The results was written into:\n\t\t{os.path.abspath(final_results)}\n{'-' * 80}")
+            QMessageBox.information(self, "Success", "Batch SSRs extraction completed successfully!")
 
 if __name__ == "__main__":
     from PyQt5.QtWidgets import QApplication
@@ -0,0 +1,132 @@
+'''
+Copyright 2024 JunqiaoZhu Zhejiang Sci-Tech University
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+'''
+Headless SSR finder, sharing its engine and defaults with the SSR Finder window.
+Run from the toolkit directory:
+
+    python -m modules.function_modules.SSR.SSR_cli -i "genomes/*.gb" -o results --jobs 8
+'''
+
+import os
+import sys
+import glob
+import json
+import argparse
+from modules.function_modules.SSR.SSR_engine import DEFAULT_TYPE_LENGTHS, run_SSR_batch
+from modules.function_modules.SSR.SSR_stats import species_name, write_statistics
+
+GENBANK_SUFFIXES = ('.gb', '.gbk')
+SUMMARY_FILE = 'SSR_summary.json'
+
+
+def collect_input_files(patterns):
+    """Expand directories and glob patterns into a sorted, de-duplicated list of GenBank files."""
+    input_files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            input_files.update(os.path.join(pattern, name) for name in os.listdir(pattern)
+                               if name.lower().endswith(GENBANK_SUFFIXES))
+        else:
+            input_files.update(path for path in glob.glob(pattern) if os.path.isfile(path))
+    return sorted(os.path.abspath(path) for path in input_files)
+
+
+def parse_type_lengths(text):
+    try:
+        type_lengths = [int(value) for value in text.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid SSR lengths '{text}'")
+    if len(type_lengths) != 6 or min(type_lengths) < 1:
+        raise argparse.ArgumentTypeError("SSR lengths must be six positive integers, e.g. 10,5,4,3,3,3")
+    return type_lengths
+
+
+def parse_density(text):
+    try:
+        window, step = (int(value) for value in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid density window '{text}', expected WINDOW,STEP")
+    if window < 1 or step < 1:
+        raise argparse.ArgumentTypeError("density window and step must be positive")
+    return window, step
+
+
+def write_summary(output_file, type_lengths, max_interruption, density, results, errors, statistics_files):
+    output_directory = os.path.dirname(output_file)
+    summary = {
+        'type_lengths': type_lengths,
+        'max_interruption': max_interruption,
+        'density': None if density is None else {'window': density[0], 'step': density[1]},
+        'genomes': [
+            {'input_file': input_file, 'name': name, 'species': species_name(name),
+             'anno_file': os.path.join(output_directory, name + '.anno'),
+             'density_file': None if density is None else os.path.join(output_directory, name + '_SSR_density.txt'),
+             'SSRs': SSR_number, 'annotated_SSRs': sum(counts.loctype.values()),
+             'length': counts.length, 'type': counts.type, 'loctype': counts.loctype}
+            for input_file, (name, SSR_number, counts) in results.items()
+        ],
+        'errors': [{'input_file': input_file, 'error': error} for input_file, error in errors],
+        'statistics_files': statistics_files,
+    }
+    with open(output_file, 'w') as f:
+        json.dump(summary, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find and annotate SSRs in chloroplast GenBank files without the GUI.")
+    parser.add_argument('-i', '--input', nargs='+', required=True,
+                        help='GenBank files, glob patterns (quote them) or directories holding .gb/.gbk files')
+    parser.add_argument('-o', '--output', required=True, help='Output directory, created if missing')
+    parser.add_argument('-k', '--kmer_length', type=parse_type_lengths, default=list(DEFAULT_TYPE_LENGTHS),
+                        help='Minimum repeat numbers of mono- to hexa-nucleotide SSRs, default is ' +
+                             ','.join(map(str, DEFAULT_TYPE_LENGTHS)))
+    parser.add_argument('-c', '--compound', type=int, metavar='MAX_INTERRUPTION',
+                        help='Merge SSRs at most MAX_INTERRUPTION bases apart into compound SSRs (MISA uses 100)')
+    parser.add_argument('-d', '--density', type=parse_density, metavar='WINDOW,STEP',
+                        help='Also write each genome\'s SSR density in sliding windows, e.g. 1000,500')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes, default is the number of CPU cores')
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.compound is not None and args.compound < 0:
+        parser.error("--compound must not be negative")
+
+    input_files = collect_input_files(args.input)
+    if not input_files:
+        parser.error("no .gb/.gbk files matched the input")
+    os.makedirs(args.output, exist_ok=True)
+
+    def report_progress(done, total, input_file, error):
+        status = f"failed: {error}" if error else "done"
+        print(f"[{done}/{total}] {os.path.basename(input_file)} {status}", file=sys.stderr)
+
+    results, errors = run_SSR_batch(input_files, args.output, args.kmer_length, args.jobs, report_progress,
+                                   max_interruption=args.compound, density=args.density)
+    statistics_files = []
+    if results:
+        all_counts = {species_name(name): counts for name, _, counts in results.values()}
+        statistics_files = write_statistics(all_counts, args.output)
+    summary_file = os.path.join(args.output, SUMMARY_FILE)
+    write_summary(summary_file, args.kmer_length, args.compound, args.density, results, errors, statistics_files)
+
+    print(f"{len(results)} of {len(input_files)} genomes analysed, summary written to {summary_file}", file=sys.stderr)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+'''
+Copyright 2024 JunqiaoZhu Zhejiang Sci-Tech University
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import numpy as np
+from modules.function_modules.SSR.SSR_stats import COMPOUND_CLASS, motif_class
+
+# Motif classes broken down in every window, in column order
+DENSITY_CLASSES = ('P1', 'P2', 'P3', 'P4', 'P5', 'P6', COMPOUND_CLASS)
+DENSITY_HEADER = "Start\tEnd\tMidpoint\tSSRs\tSSRs_per_kb\tCovered_bp\t" + '\t'.join(DENSITY_CLASSES)
+
+
+def window_starts(genome_length, window, step):
+    """Return the 1-based starts of the windows laid out as in the Pi window tables."""
+    if genome_length < window:
+        return np.zeros(0, dtype=np.int64)
+    loop = int((genome_length - window) / step)
+    return np.arange(loop + 1, dtype=np.int64) * step + 1
+
+
+def SSR_density(SSRs, genome_length, window, step):
+    """Count SSRs along a genome in sliding windows.
+
+    An SSR is counted in every window holding its start, so windows are
+    answered by binary search on the sorted starts. Covered_bp counts the
+    bases of a window inside at least one SSR, from a prefix sum over the
+    SSR coverage of the genome. Returns the window starts and ends and a
+    {column: array} mapping for the other columns of DENSITY_HEADER.
+    """
+    starts = np.array([SSR.start for SSR in SSRs], dtype=np.int64)
+    ends = np.array([SSR.end for SSR in SSRs], dtype=np.int64)
+    classes = np.array([motif_class(SSR.motif) for SSR in SSRs], dtype=object)
+    order = np.argsort(starts, kind='stable')
+    starts, ends, classes = starts[order], ends[order], classes[order]
+
+    win_starts = window_starts(genome_length, window, step)
+    win_ends = win_starts + window - 1
+
+    # Bases covered by at least one SSR, clipped to the genome
+    depth = np.zeros(genome_length + 2, dtype=np.int64)
+    np.add.at(depth, np.clip(starts, 1, genome_length + 1), 1)
+    np.add.at(depth, np.clip(ends + 1, 1, genome_length + 1), -1)
+    covered = np.zeros(genome_length + 1, dtype=np.int64)
+    np.cumsum(np.cumsum(depth)[1:genome_length + 1] > 0, out=covered[1:])
+
+    columns = {}
+    counts = np.searchsorted(starts, win_ends, side='right') - np.searchsorted(starts, win_starts, side='left')
+    columns['SSRs'] = counts
+    columns['SSRs_per_kb'] = counts * 1000 / window
+    columns['Covered_bp'] = covered[win_ends] - covered[win_starts - 1]
+    for length_class in DENSITY_CLASSES:
+        class_starts = starts[classes == length_class]
+        columns[length_class] = (np.searchsorted(class_starts, win_ends, side='right') -
+                                 np.searchsorted(class_starts, win_starts, side='left'))
+    return win_starts, win_ends, columns
+
+
+def write_density(output_file, SSRs, genome_length, window, step):
+    """Write the SSR density table in the Start/End/Midpoint layout read by the Pi plotter."""
+    win_starts, win_ends, columns = SSR_density(SSRs, genome_length, window, step)
+    with open(output_file, 'w') as f:
+        f.write(DENSITY_HEADER + '\n')
+        for i, (start, end) in enumerate(zip(win_starts.tolist(), win_ends.tolist())):
+            row = [start, end, (start + end) // 2, int(columns['SSRs'][i]), f"{columns['SSRs_per_kb'][i]:.5f}",
+                   int(columns['Covered_bp'][i])] + [int(columns[length_class][i]) for length_class in DENSITY_CLASSES]
+            f.write('\t'.join(map(str, row)) + '\n')
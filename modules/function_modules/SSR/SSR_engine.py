@@ -0,0 +1,384 @@
+"""
+This code is built based on the following work
+CPStools-SSR_analysis.py
+Author: Xu wenbo
+Org:    China Pharmaceutical University
+Email:  xwb7533@163.com
+site:   https://github.com/Xwb7533/CPStools
+"""
+
+import os
+import heapq
+from bisect import bisect_right, insort
+from collections import namedtuple
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from Bio import SeqIO
+from modules.function_modules.SSR.SSR_stats import count_SSR_rows
+from modules.function_modules.SSR.SSR_density import write_density
+
+# Minimum repeat numbers of mono- to hexanucleotide SSRs used by the SSR finder
+DEFAULT_TYPE_LENGTHS = [10, 5, 4, 3, 3, 3]
+
+# One SSR: its motif, number of copies and 1-based inclusive start and end. A
+# compound SSR spells its components MISA style in motif, e.g. (AT)6aggc(AG)5,
+# with a trailing * when components overlap, and counts its components in copies
+SSRRecord = namedtuple('SSRRecord', ['motif', 'copies', 'start', 'end'])
+SSR_HEADER = "type\tlength\tstart\tend"
+
+# One Gene/IGS/Intron region; parts holds its inclusive (start, end) pieces, so a
+# region running over the origin of a circular genome has one piece on each side
+Region = namedtuple('Region', ['name', 'parts', 'loc_type'])
+
+# A GenBank record parsed once for the whole SSR pipeline. genes lists the
+# CDS/tRNA/rRNA features as (gene name, [(start, end, strand), ...]) in file order
+Genome = namedtuple('Genome', ['name', 'seq', 'length', 'genes'])
+ANNO_HEADER = SSR_HEADER + "\tloc\tloc_type"
+
+_SSR_BASES = np.zeros(256, dtype=bool)
+_SSR_BASES[list(b'ATCG')] = True
+
+
+def _repeat_runs(seq, period):
+    """Return, for every position i, how many consecutive j >= i have seq[j] == seq[j + period]."""
+    n = len(seq)
+    runs = np.zeros(n + 1, dtype=np.int64)
+    if n <= period:
+        return runs
+    same = seq[:-period] == seq[period:]
+    # Index of the next mismatch at or after each position
+    next_break = np.where(same, len(same), np.arange(len(same)))
+    next_break = np.minimum.accumulate(next_break[::-1])[::-1]
+    runs[:len(same)] = next_break - np.arange(len(same))
+    return runs
+
+
+def _window_any(flags, width):
+    """Return whether any of flags[i:i + width] is set, for every position i."""
+    counts = np.concatenate(([0], np.cumsum(flags)))
+    ends = np.minimum(np.arange(len(flags)) + width, len(flags))
+    return counts[ends] - counts[:-1] > 0
+
+
+class SSRIndex:
+    """SSR records keyed by start, iterated in start order.
+
+    A start can hold a single record, so duplicate checks are a dict lookup.
+    """
+
+    def __init__(self, records=()):
+        self.by_start = {}
+        self.starts = []
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        """Add a record unless its start is taken; return whether it was added."""
+        if record.start in self.by_start:
+            return False
+        self.by_start[record.start] = record
+        if not self.starts or record.start > self.starts[-1]:
+            self.starts.append(record.start)
+        else:
+            insort(self.starts, record.start)
+        return True
+
+    def __contains__(self, start):
+        return start in self.by_start
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return (self.by_start[start] for start in self.starts)
+
+
+def format_SSR(record):
+    """Return the tab-separated row of an SSR record."""
+    return f"{record.motif}\t{record.copies}\t{record.start}\t{record.end}"
+
+
+def scan_SSRs(my_seq, type_lengths=DEFAULT_TYPE_LENGTHS):
+    """Find mono- to hexanucleotide SSRs in a single sweep over a sequence.
+
+    type_lengths holds the minimum repeat number of each motif period. The
+    result follows the CPStools regular expressions exactly: each period is
+    scanned left to right without overlapping its own previous hit, motifs
+    made of a shorter repeat are skipped (homopolymers for every period,
+    dinucleotides for period 4, trinucleotides for period 6), and a start
+    already taken by a shorter period is left to it. Returns an SSRIndex of
+    SSRRecord entries.
+    """
+    seq = np.frombuffer(my_seq.encode(), dtype=np.uint8)
+    n = len(seq)
+    bases = _SSR_BASES[seq]
+    base_counts = np.concatenate(([0], np.cumsum(bases)))
+    positions = np.arange(n)
+    homopolymer_runs = _repeat_runs(seq, 1)[:n]
+
+    starts, periods, copies = [], [], []
+    for period, min_copies in enumerate(type_lengths, start=1):
+        runs = _repeat_runs(seq, period)[:n]
+        in_range = positions + period <= n
+        ends = np.minimum(positions + period, n)
+        valid = in_range & (base_counts[ends] - base_counts[positions] == period)
+        if period > 1:
+            # A motif may not open a homopolymer run of its own length at any of its bases
+            homopolymer = bases & (homopolymer_runs >= period - 1)
+            valid &= ~_window_any(homopolymer, period)
+        if period == 4:
+            valid &= ~(_repeat_runs(seq, 2)[:n] >= 2)
+        if period == 6:
+            valid &= ~(_repeat_runs(seq, 3)[:n] >= 3)
+        period_copies = 1 + runs // period
+        hits = np.flatnonzero(valid & (period_copies >= min_copies))
+        starts.append(hits)
+        periods.append(np.full(len(hits), period))
+        copies.append(period_copies[hits])
+
+    starts, periods, copies = np.concatenate(starts), np.concatenate(periods), np.concatenate(copies)
+    order = np.lexsort((periods, starts))
+    next_start = [0] * 7
+    all_SSRs = SSRIndex()
+    for start, period, copy in zip(starts[order].tolist(), periods[order].tolist(), copies[order].tolist()):
+        if start < next_start[period]:
+            continue
+        end = start + period * copy
+        next_start[period] = end
+        if start + 1 not in all_SSRs:
+            all_SSRs.add(SSRRecord(my_seq[start:start + period], copy, start + 1, end))
+    return all_SSRs
+
+
+class RegionIndex:
+    """Resolve genome positions to Gene/IGS/Intron regions by binary search.
+
+    Regions are given in priority order: where several cover a base, the
+    earliest one owns it. The genome is cut at every region boundary into
+    segments, each owned by a single region, so a lookup is one bisect plus
+    a walk over the few segments an SSR spans.
+    """
+
+    def __init__(self, regions):
+        events = sorted((position, kind, priority)
+                        for priority, region in enumerate(regions)
+                        for start, end in region.parts if start <= end
+                        for position, kind in ((start, 1), (end + 1, 0)))
+        self.regions = list(regions)
+        self.bounds = []
+        self.owners = []
+        active, depth = [], [0] * len(self.regions)
+        for index, (position, kind, priority) in enumerate(events):
+            if kind:
+                depth[priority] += 1
+                heapq.heappush(active, priority)
+            else:
+                depth[priority] -= 1
+            if index + 1 < len(events) and events[index + 1][0] == position:
+                continue
+            while active and not depth[active[0]]:
+                heapq.heappop(active)
+            self.bounds.append(position)
+            self.owners.append(active[0] if active else None)
+
+    def locate(self, start, end):
+        """Return the regions owning bases start..end, in the order they are first met."""
+        found, names = [], set()
+        if end < start:
+            return found
+        segment = bisect_right(self.bounds, start) - 1
+        while segment < len(self.bounds) and (segment < 0 or self.bounds[segment] <= end):
+            owner = self.owners[segment] if segment >= 0 else None
+            if owner is not None and self.regions[owner].name not in names:
+                names.add(self.regions[owner].name)
+                found.append(self.regions[owner])
+            segment += 1
+        return found
+
+
+def _compound_record(group, my_seq):
+    motif, overlapped, end = "", False, group[0].start - 1
+    for SSR in group:
+        if SSR.start > end + 1:
+            motif += my_seq[end:SSR.start - 1].lower()
+        elif SSR.start <= end:
+            overlapped = True
+        motif += f"({SSR.motif}){SSR.copies}"
+        end = max(end, SSR.end)
+    return SSRRecord(motif + ("*" if overlapped else ""), len(group), group[0].start, end)
+
+
+def merge_compound_SSRs(SSRs, my_seq, max_interruption):
+    """Merge SSRs lying at most max_interruption bases apart into compound SSRs.
+
+    SSRs are taken in start order in a single pass: each one joins the current
+    compound while its start is within max_interruption bases of the furthest
+    end seen so far, as in MISA. Overlapping SSRs always merge. Isolated SSRs
+    are kept unchanged. Returns a new SSRIndex.
+    """
+    merged = SSRIndex()
+    group, group_end = [], 0
+    for SSR in SSRs:
+        if group and SSR.start - group_end - 1 <= max_interruption:
+            group.append(SSR)
+            group_end = max(group_end, SSR.end)
+            continue
+        if group:
+            merged.add(group[0] if len(group) == 1 else _compound_record(group, my_seq))
+        group, group_end = [SSR], SSR.end
+    if group:
+        merged.add(group[0] if len(group) == 1 else _compound_record(group, my_seq))
+    return merged
+
+
+def annotate_SSRs(SSRs, regions):
+    """Return (SSR record, region) pairs placing every SSR in the regions it touches.
+
+    As in the CPStools location step, the last base of each SSR is not
+    looked up, and an SSR lying outside every region is left out.
+    """
+    index = regions if isinstance(regions, RegionIndex) else RegionIndex(regions)
+    return [(SSR, region) for SSR in SSRs for region in index.locate(SSR.start, SSR.end - 1)]
+
+
+def load_genome(input_file):
+    """Parse the first record of a GenBank file into a Genome."""
+    if not (input_file.endswith('.gb') or input_file.endswith('.gbk')):
+        raise ValueError(f"Unsupported file format for '{input_file}'. Please use GenBank (.gb or .gbk) files.")
+    if not os.path.exists(input_file):
+        raise FileNotFoundError(f"No such file: {input_file}")
+    try:
+        rec = next(SeqIO.parse(input_file, 'genbank'))
+    except StopIteration:
+        raise ValueError(f"Error processing file '{input_file}': no GenBank record found")
+    except Exception as e:
+        raise ValueError(f"Error processing file '{input_file}': {e}")
+    genes = [(feature.qualifiers['gene'][0], [(int(part.start), int(part.end), part.strand) for part in feature.location.parts])
+             for feature in rec.features if feature.type in ('CDS', 'tRNA', 'rRNA')]
+    return Genome(os.path.basename(input_file).split('.')[0], str(rec.seq), int(rec.features[0].location.parts[0].end), genes)
+
+
+def _loc_type(name, loc_type):
+    # The matK/trnK-UUU spacer and the spacer between two exons of one gene are introns
+    if "matK" in name and "trnK-UUU" in name:
+        return "Intron"
+    name_parts = name.split('_')
+    if len(name_parts) == 3 and name_parts[0] in name_parts[1]:
+        return "Intron"
+    return loc_type
+
+
+def genome_regions(genome):
+    """Return the Gene, IGS and Intron regions of a genome in CPStools priority order.
+
+    Every exon is a Gene region (a gene crossing the origin stays whole) and
+    every gap between consecutive genes is an IGS; the last gap runs over the
+    origin back to the first gene.
+    """
+    all_info = set()
+    for gene_name, exons in genome.genes:
+        if len(exons) == 1:
+            all_info.add((gene_name, exons[0][0], exons[0][1]))
+        elif len(exons) == 2 and exons[0][1] == genome.length:
+            all_info.add((gene_name, exons[0][0], exons[0][1], exons[1][0], exons[1][1]))
+        elif len(exons) in (2, 3):
+            for number, (start, end, strand) in enumerate(exons, start=1):
+                all_info.add((f"{gene_name}_{number}", start, end))
+    all_info = sorted(all_info, key=lambda info: (info[1], info))
+    if not all_info:
+        return []
+
+    regions = []
+    for info, next_info in zip(all_info, all_info[1:]):
+        regions.append(Region(info[0], ((info[1], info[2]),), "Gene"))
+        regions.append(Region(f"{info[0]}-{next_info[0]}", ((info[-1], next_info[1]),), "IGS"))
+    last_info, first_info = all_info[-1], all_info[0]
+    regions.append(Region(last_info[0], tuple(zip(last_info[1::2], last_info[2::2])), "Gene"))
+    if last_info[-1] < first_info[1]:
+        regions.append(Region(f"{last_info[0]}-{first_info[0]}", ((last_info[-1], first_info[1]),), "Gene"))
+    elif last_info[2] < genome.length:
+        regions.append(Region(f"{last_info[0]}-{first_info[0]}",
+                              ((last_info[-1], genome.length), (0, first_info[1])), "IGS"))
+    return [region._replace(loc_type=_loc_type(region.name, region.loc_type)) for region in regions]
+
+
+def find_SSRs(genome, type_lengths=DEFAULT_TYPE_LENGTHS, max_interruption=None):
+    """Scan a genome for SSRs, merging them into compound SSRs unless max_interruption is None."""
+    all_SSRs = scan_SSRs(genome.seq, type_lengths)
+    if max_interruption is not None:
+        all_SSRs = merge_compound_SSRs(all_SSRs, genome.seq, max_interruption)
+    return all_SSRs
+
+
+def analyze_genome(genome, type_lengths=DEFAULT_TYPE_LENGTHS, max_interruption=None):
+    """Find the SSRs of a genome and return them as (SSR record, region) pairs."""
+    return annotate_SSRs(find_SSRs(genome, type_lengths, max_interruption), genome_regions(genome))
+
+
+def write_annotation(output_file, annotated):
+    with open(output_file, 'w') as ff:
+        ff.write(f"{ANNO_HEADER}\n")
+        for SSR, region in annotated:
+            ff.write(f"{format_SSR(SSR)}\t{region.name}\t{region.loc_type}\n")
+
+
+def analyze_file(input_file, output_directory, type_lengths=DEFAULT_TYPE_LENGTHS, max_interruption=None,
+                 density=None):
+    """Write the .anno table of one GenBank file and return its name, SSR number and SSRCounts.
+
+    With density given as (window, step), the SSR density track is also
+    written to <name>_SSR_density.txt.
+    """
+    genome = load_genome(input_file)
+    all_SSRs = find_SSRs(genome, type_lengths, max_interruption)
+    annotated = annotate_SSRs(all_SSRs, genome_regions(genome))
+    write_annotation(os.path.join(output_directory, genome.name + ".anno"), annotated)
+    if density is not None:
+        write_density(os.path.join(output_directory, genome.name + "_SSR_density.txt"), all_SSRs, len(genome.seq),
+                      *density)
+    return genome.name, len(all_SSRs), count_SSR_rows((SSR.motif, region.loc_type) for SSR, region in annotated)
+
+
+def run_SSR_batch(input_files, output_directory, type_lengths=DEFAULT_TYPE_LENGTHS, jobs=None,
+                  progress_callback=None, is_cancelled=None, max_interruption=None, density=None):
+    """Run analyze_file over many genomes on a pool of `jobs` processes (all cores when None).
+
+    progress_callback(done, total, input_file, error) is called as every file
+    finishes, with the error message of a failed file or None. is_cancelled is
+    polled between files; once it returns True no further file is started.
+    With max_interruption set, nearby SSRs are reported as compound SSRs, and
+    with density set, each genome's SSR density track is written as well.
+    Returns {input_file: analyze_file result} in input order and a list of
+    (input_file, error message) pairs.
+    """
+    results, errors = {}, []
+
+    def collect(done, input_file, future_result):
+        try:
+            results[input_file] = future_result()
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            errors.append((input_file, error))
+        if progress_callback is not None:
+            progress_callback(done, len(input_files), input_file, error)
+
+    if jobs == 1:
+        for done, input_file in enumerate(input_files, start=1):
+            if is_cancelled is not None and is_cancelled():
+                break
+            collect(done, input_file, lambda: analyze_file(input_file, output_directory, type_lengths,
+                                                              max_interruption, density))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {executor.submit(analyze_file, input_file, output_directory, type_lengths,
+                                       max_interruption, density): input_file
+                       for input_file in input_files}
+            for done, future in enumerate(as_completed(futures), start=1):
+                collect(done, futures[future], future.result)
+                if is_cancelled is not None and is_cancelled():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+
+    return {input_file: results[input_file] for input_file in input_files if input_file in results}, errors
@@ -16,10 +16,9 @@ limitations under the License.
 
 import sys
 import os
-import pandas as pd
-from tqdm import tqdm
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, 
                              QFileDialog, QMessageBox, QHBoxLayout)
+from modules.function_modules.SSR.SSR_stats import LENGTH_TABLE, collect_SSR_counts, write_statistics
 
 class SSRCounter_lengthApp(QWidget):
     def __init__(self):
@@ -69,48 +68,21 @@ class SSRCounter_lengthApp(QWidget):
             self.selected_files = files
             self.entry_directory.setText(", ".join(files))
 
-    def count_repeats(self, file_path):
-        df = pd.read_csv(file_path, sep='\t', header=None, skiprows=1)
-        repeat_counts = df[0].value_counts()
-        
-        length_counts = {}
-        for repeat, count in repeat_counts.items():
-            length = len(repeat)
-            key = f'P{length}'
-            if key in length_counts:
-                length_counts[key] += count
-            else:
-                length_counts[key] = count
-        
-        return length_counts
-
-    def main(self, files, output_file):
-        all_length_counts = {}
-        
-        for file in tqdm(files, desc="Processing files"):
-            file_path = file
-            species_name = '_'.join(os.path.basename(file).split('_')[:2])
-            species_name = species_name.replace('_', ' ')
-            length_counts = self.count_repeats(file_path)
-            all_length_counts[species_name] = length_counts
-        
-        all_keys = sorted(set.union(*[set(counts.keys()) for counts in all_length_counts.values()]), key=lambda x: int(x[1:]))
-        
-        with open(output_file, 'w') as f:
-            f.write('Species\t' + '\t'.join(all_keys) + '\tTotal\n')
-            
-            for species_name, length_counts in all_length_counts.items():
-                counts = [length_counts.get(key, 0) for key in all_keys]
-                sum_counts = sum(counts)
-                f.write(species_name + '\t' + '\t'.join(map(str, counts)) + f'\t{sum_counts}\n')
+    def main(self, files, directory):
+        # Every file is read once and cached, so running again only re-reads files that changed
+        try:
+            all_counts = collect_SSR_counts(files)
+            output_file, = write_statistics(all_counts, directory, (LENGTH_TABLE,))
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Error counting SSRs: {e}")
+            return
 
         QMessageBox.information(self, "Success", f"Output file has been created: {output_file}")
 
     def start_processing(self):
         if self.selected_files:
             directory = os.path.dirname(self.selected_files[0])
-            output_file = os.path.join(directory, 'output_SSR_counts_length.statistics')
-            self.main(self.selected_files, output_file)
+            self.main(self.selected_files, directory)
         else:
             QMessageBox.warning(self, "Warning", "Please select files first.")
 
@@ -16,11 +16,9 @@ limitations under the License.
 
 import sys
 import os
-import pandas as pd
-from tqdm import tqdm
-import matplotlib.pyplot as plt
 from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, 
                              QFileDialog, QMessageBox, QHBoxLayout)
+from modules.function_modules.SSR.SSR_stats import LOCTYPE_TABLE, collect_SSR_counts, write_statistics
 
 class SSRCounter_loctypeApp(QWidget):
     def __init__(self):
@@ -70,41 +68,21 @@ class SSRCounter_loctypeApp(QWidget):
             self.selected_files = files
             self.entry_directory.setText(", ".join(files))
 
-    def count_type_counts(self, file_path):
-        # Count different types in the sixth column
-        df = pd.read_csv(file_path, sep='\t')
-        type_counts = df.iloc[:, 5].value_counts()  # 6th column index is 5
-        
-        return type_counts.to_dict()
-
-    def main(self, files, output_file):
-        all_type_counts = {}
-        
-        for file in tqdm(files, desc="Processing files"):
-            file_path = file
-            species_name = '_'.join(os.path.basename(file).split('_')[:2])
-            species_name = species_name.replace('_', ' ').replace('.anno', '')
-            type_counts = self.count_type_counts(file_path)
-            all_type_counts[species_name] = type_counts
-        
-        all_types = sorted(set.union(*[set(counts.keys()) for counts in all_type_counts.values()]))
-        
-        with open(output_file, 'w') as f:
-            # Write header
-            f.write('Species\t' + '\t'.join(all_types) + '\n')
-            
-            # Write data for each species
-            for species_name, type_counts in all_type_counts.items():
-                counts = [type_counts.get(key, 0) for key in all_types]
-                f.write(species_name + '\t' + '\t'.join(map(str, counts)) + '\n')
+    def main(self, files, directory):
+        # Every file is read once and cached, so running again only re-reads files that changed
+        try:
+            all_counts = collect_SSR_counts(files)
+            output_file, = write_statistics(all_counts, directory, (LOCTYPE_TABLE,))
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Error counting SSRs: {e}")
+            return
 
         QMessageBox.information(self, "Success", f"Output file has been created: {output_file}")
 
     def start_processing(self):
         if self.selected_files:
             directory = os.path.dirname(self.selected_files[0])
-            output_file = os.path.join(directory, 'output_SSR_counts_loctype.statistics')
-            self.main(self.selected_files, output_file)
+            self.main(self.selected_files, directory)
         else:
             QMessageBox.warning(self, "Warning", "Please select files first.")
 
@@ -0,0 +1,185 @@
+'''
+Copyright 2024 JunqiaoZhu Zhejiang Sci-Tech University
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+'''
+
+import os
+from itertools import product
+from collections import Counter, namedtuple
+
+# Per-species SSR counts by motif length (P1..P6), by motif and by location type
+SSRCounts = namedtuple('SSRCounts', ['length', 'type', 'loctype'])
+
+LENGTH_TABLE = 'output_SSR_counts_length.statistics'
+TYPE_TABLE = 'output_SSR_counts_type_1.statistics'
+COMPLEMENTARY_TYPE_TABLE = 'output_SSR_counts_type_2.statistics'
+LOCTYPE_TABLE = 'output_SSR_counts_loctype.statistics'
+# Optional table grouping the rotations of a motif and of its reverse complement, as MISA's motif classes
+ROTATION_TYPE_TABLE = 'output_SSR_counts_type_3.statistics'
+ALL_TABLES = (LENGTH_TABLE, TYPE_TABLE, COMPLEMENTARY_TYPE_TABLE, LOCTYPE_TABLE)
+
+# Length and type class of compound SSRs, whose motifs are written as (AT)6aggc(AG)5
+COMPOUND_CLASS = 'c'
+
+_COMPLEMENT = {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C'}
+
+# Counts of every .anno file read so far, keyed by absolute path and checked against its mtime and size
+_COUNTS_CACHE = {}
+
+
+def species_name(name):
+    """Turn a genome or result file name such as Avena_sativa.anno into 'Avena sativa'."""
+    return ' '.join(name.split('_')[:2]).replace('.anno', '')
+
+
+def motif_class(motif):
+    """Return P1..P6 for a perfect SSR motif and 'c' for a compound SSR."""
+    return COMPOUND_CLASS if motif.startswith('(') else f'P{len(motif)}'
+
+
+def _length_order(length_class):
+    return (length_class == COMPOUND_CLASS, 0 if length_class == COMPOUND_CLASS else int(length_class[1:]))
+
+
+def count_SSR_rows(rows):
+    """Count annotated SSR rows given as (motif, loc_type) pairs; compound SSRs share the 'c' class.
+
+    A row with an empty loc_type only adds to the length and motif counts.
+    """
+    length, type_, loctype = Counter(), Counter(), Counter()
+    for motif, loc_type in rows:
+        length_class = motif_class(motif)
+        length[length_class] += 1
+        type_[motif if length_class != COMPOUND_CLASS else COMPOUND_CLASS] += 1
+        if loc_type:
+            loctype[loc_type] += 1
+    return SSRCounts(dict(length), dict(type_), dict(loctype))
+
+
+def read_SSR_counts(file_path):
+    """Count the SSRs of one .anno file in a single pass over its rows.
+
+    The motif is the first column and the location type the sixth; the
+    header row is skipped.
+    """
+    with open(file_path) as f:
+        next(f, None)
+        fields = (line.rstrip('\r\n').split('\t') for line in f)
+        return count_SSR_rows((row[0], row[5] if len(row) > 5 else None) for row in fields if row[0])
+
+
+def load_SSR_counts(file_path):
+    """Return the SSRCounts of a .anno file, reading it again only when it has changed."""
+    path = os.path.abspath(file_path)
+    stat = os.stat(path)
+    cached = _COUNTS_CACHE.get(path)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]
+    counts = read_SSR_counts(path)
+    _COUNTS_CACHE[path] = ((stat.st_mtime_ns, stat.st_size), counts)
+    return counts
+
+
+def collect_SSR_counts(files):
+    """Return {species: SSRCounts} for .anno files, named after their first two name fields."""
+    return {species_name(os.path.basename(file)): load_SSR_counts(file) for file in files}
+
+
+def _rotation_min(seq):
+    return min(seq[i:] + seq[:i] for i in range(len(seq)))
+
+
+def _class_tables():
+    """Return the complementary and rotation class of every motif of length 1 to 6 (5,460 motifs)."""
+    complementary, rotation = {}, {}
+    for length in range(1, 7):
+        for bases in product('ACGT', repeat=length):
+            motif = ''.join(bases)
+            rev_comp = ''.join(_COMPLEMENT[base] for base in reversed(motif))
+            complementary[motif] = '/'.join(sorted((motif, rev_comp)))
+            rotation[motif] = '/'.join(sorted((_rotation_min(motif), _rotation_min(rev_comp))))
+    return complementary, rotation
+
+
+# Built once at import, so classifying a motif is a single dict lookup
+_COMPLEMENTARY_CLASSES, _ROTATION_CLASSES = _class_tables()
+
+
+def reverse_complement(seq):
+    try:
+        return ''.join(_COMPLEMENT[base] for base in reversed(seq))
+    except KeyError as e:
+        print(f"Warning: Skipping invalid character {e} in sequence {seq}")
+        return seq
+
+
+def canonical_key(seq):
+    """Return the 'motif/reverse complement' class of a motif, smaller sequence first."""
+    key = _COMPLEMENTARY_CLASSES.get(seq)
+    if key is None:
+        rev_comp = reverse_complement(seq)
+        key = f"{seq}/{rev_comp}" if seq < rev_comp else f"{rev_comp}/{seq}"
+    return key
+
+
+def rotation_key(seq):
+    """Return the MISA-style class of a motif: its smallest rotation and that of its reverse complement.
+
+    AG, GA, CT and TC all fall in AG/CT.
+    """
+    key = _ROTATION_CLASSES.get(seq)
+    if key is None:
+        key = '/'.join(sorted((_rotation_min(seq), _rotation_min(reverse_complement(seq)))))
+    return key
+
+
+def complementary_counts(type_counts, rotations=False):
+    """Merge motif counts into complementary classes, or into rotation classes with rotations."""
+    classify = rotation_key if rotations else canonical_key
+    classified = Counter()
+    for type_, count in type_counts.items():
+        classified[type_ if type_ == COMPOUND_CLASS else classify(type_)] += count
+    return dict(classified)
+
+
+def write_count_table(output_file, all_counts, sort_key=None, total=True):
+    """Write a Species x category table from a {species: {category: count}} mapping."""
+    all_keys = sorted(set().union(*[set(counts) for counts in all_counts.values()]), key=sort_key)
+    with open(output_file, 'w') as f:
+        f.write('Species\t' + '\t'.join(all_keys) + ('\tTotal\n' if total else '\n'))
+        for species, counts in all_counts.items():
+            row = [counts.get(key, 0) for key in all_keys]
+            f.write(species + '\t' + '\t'.join(map(str, row)) + (f'\t{sum(row)}\n' if total else '\n'))
+
+
+def write_statistics(all_counts, output_directory, tables=ALL_TABLES):
+    """Write statistics tables from {species: SSRCounts}, the usual four unless tables names others.
+
+    Returns the paths written.
+    """
+    columns = {
+        LENGTH_TABLE: (lambda counts: counts.length, _length_order, True),
+        TYPE_TABLE: (lambda counts: counts.type, None, True),
+        COMPLEMENTARY_TYPE_TABLE: (lambda counts: complementary_counts(counts.type), None, True),
+        ROTATION_TYPE_TABLE: (lambda counts: complementary_counts(counts.type, rotations=True), None, True),
+        LOCTYPE_TABLE: (lambda counts: counts.loctype, None, False),
+    }
+    paths = []
+    for file_name in tables:
+        select, sort_key, total = columns[file_name]
+        table = {species: select(counts) for species, counts in all_counts.items()}
+        path = os.path.join(output_directory, file_name)
+        write_count_table(path, table, sort_key, total)
+        paths.append(path)
+    return paths
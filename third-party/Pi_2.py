@@ -31,12 +31,13 @@ def calculate_Pi_values(work_dir):
                         b.append(i)
             all_number = len(a) * (len(a) - 1) / 2
             # delete all have '-' in seq location
-            all_del = sorted(set(b))[::-1]
+            all_del = set(b)
+            keep = None
             for rec in SeqIO.parse(fasta_file, 'fasta'):
-                for x in all_del:
-                    rec.seq = list(rec.seq)
-                    del rec.seq[x]
-                d.append(rec.seq)
+                seq = str(rec.seq)
+                if keep is None:
+                    keep = [i for i in range(len(seq)) if i not in all_del]
+                d.append(''.join([seq[i] for i in keep]))
             # statistics same and diff
             for y in range(len(d[0])):
                 c = []
@@ -61,33 +62,35 @@ def calculate_Pi_values(work_dir):
     return pi_results
 
 
+def sort_as_cp_order(input_file1, input_file2, results_file_path):
+    # index every Pi result by locus name once, then walk the cp order file
+    pi_index = {}
+    with open(input_file1, 'r') as pi_results:
+        for pi_line in pi_results:
+            pi_index.setdefault(pi_line.split('\t')[0], []).append(pi_line)
+    with open(input_file2, 'r') as cp_order_results:
+        cp_order = [cp_line.strip() for cp_line in cp_order_results if cp_line.strip()]
+    with open(results_file_path, 'w') as reuslts_file:
+        for name in cp_order:
+            for pi_line in pi_index.get(name, []):
+                print(pi_line, end='')
+                reuslts_file.write(pi_line)
+    cp_order_names = set(cp_order)
+    missing_results = [name for name in cp_order if name not in pi_index]
+    missing_reference = [name for name in pi_index if name not in cp_order_names]
+    if missing_results:
+        print(f"{len(missing_results)} loci in {input_file2} have no Pi value: {', '.join(missing_results)}")
+    if missing_reference:
+        print(f"{len(missing_reference)} loci are not in {input_file2}: {', '.join(missing_reference)}")
+
+
 def IGS_sort_as_cp_order(input_file1, input_file2):
-    pi_results = open(input_file1, 'r')
-    cp_order_results = open(input_file2, 'r')
     results_file_path = os.path.join(os.path.dirname(input_file1), 'IGS_sort_as_cp_order.txt')
-    reuslts_file = open(results_file_path, 'w')
-    file1_line_list = pi_results.readlines()
-    file2_line_list = cp_order_results.readlines()
-    for IGS2 in file2_line_list:
-        for IGS1 in file1_line_list:
-            if IGS1.split('\t')[0] == IGS2.strip():
-                print(IGS1, end='')
-                reuslts_file.write(IGS1)
-    reuslts_file.close()
+    sort_as_cp_order(input_file1, input_file2, results_file_path)
 
 def gene_sort_as_cp_order(input_file1, input_file2):
-    pi_results = open(input_file1, 'r')
-    cp_order_results = open(input_file2, 'r')
     results_file_path = os.path.join(os.path.dirname(input_file1), 'gene_sort_as_cp_order.txt')
-    reuslts_file = open(results_file_path, 'w')
-    file1_line_list = pi_results.readlines()
-    file2_line_list = cp_order_results.readlines()
-    for IGS2 in file2_line_list:
-        for IGS1 in file1_line_list:
-            if IGS1.split('\t')[0] == IGS2.strip():
-                print(IGS1, end='')
-                reuslts_file.write(IGS1)
-    reuslts_file.close()
+    sort_as_cp_order(input_file1, input_file2, results_file_path)
 
 
 if __name__ == '__main__':